@@ -0,0 +1,25 @@
+"""draft answer index
+
+Revision ID: 3f1c9a7d2e54
+Revises: 5d2e9a7c4b13
+Create Date: 2026-10-18 11:02:41.208133
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2e54'
+down_revision = '5d2e9a7c4b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_answer_draft', 'answer', ['user_id', 'question_id'],
+                    postgresql_where=sa.text('interaction_id IS NULL AND template_id IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_answer_draft', table_name='answer')
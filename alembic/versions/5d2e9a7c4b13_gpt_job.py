@@ -0,0 +1,32 @@
+"""gpt job
+
+Revision ID: 5d2e9a7c4b13
+Revises: bee00468f7ba
+Create Date: 2026-10-18 21:52:37.904115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e9a7c4b13'
+down_revision = 'bee00468f7ba'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('gpt_job',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_gpt_job_created_at', 'gpt_job', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_gpt_job_created_at', table_name='gpt_job')
+    op.drop_table('gpt_job')
@@ -0,0 +1,26 @@
+"""password kdf
+
+Revision ID: 6e1f0b8c3a57
+Revises: 8c2e4b1f6a93
+Create Date: 2026-10-18 16:42:37.215904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1f0b8c3a57'
+down_revision = '8c2e4b1f6a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('auth', sa.Column('algorithm', sa.String(), server_default='hmac-sha256', nullable=False))
+    op.add_column('auth', sa.Column('params', sa.String(), server_default='', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('auth', 'params')
+    op.drop_column('auth', 'algorithm')
@@ -0,0 +1,48 @@
+"""hot query indexes
+
+Revision ID: 8c2e4b1f6a93
+Revises: 3f1c9a7d2e54
+Create Date: 2026-10-18 12:14:07.553901
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e4b1f6a93'
+down_revision = '3f1c9a7d2e54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_question_category_parent_id', 'question_category', ['parent_id'])
+    op.create_index('ix_prompt_category_order', 'prompt', ['category_id', 'order_index'],
+                    postgresql_include=['text'])
+    op.create_index('ix_question_category_order', 'question', ['category_id', 'order_index'])
+    op.create_index('ix_answer_user_interaction', 'answer', ['user_id', 'interaction_id'])
+    op.create_index('ix_answer_user_template', 'answer', ['user_id', 'template_id'])
+    op.create_index('ix_answer_interaction', 'answer', ['interaction_id'])
+    op.create_index('ix_option_question', 'option', ['question_id', 'option_text'])
+    op.create_index('ix_auth_user_id', 'auth', ['user_id'])
+    op.create_index('ix_refresh_token_user_agent', 'refresh_token', ['user_id', 'user_agent'],
+                    postgresql_include=['theme'])
+    op.create_index('ix_purchase_user_product', 'purchase', ['user_id', 'product_id'])
+    op.create_index('ix_promo_code_product_code', 'promo_code', ['product_id', 'code'])
+    op.create_index('ix_template_user_id', 'template', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_template_user_id', table_name='template')
+    op.drop_index('ix_promo_code_product_code', table_name='promo_code')
+    op.drop_index('ix_purchase_user_product', table_name='purchase')
+    op.drop_index('ix_refresh_token_user_agent', table_name='refresh_token')
+    op.drop_index('ix_auth_user_id', table_name='auth')
+    op.drop_index('ix_option_question', table_name='option')
+    op.drop_index('ix_answer_interaction', table_name='answer')
+    op.drop_index('ix_answer_user_template', table_name='answer')
+    op.drop_index('ix_answer_user_interaction', table_name='answer')
+    op.drop_index('ix_question_category_order', table_name='question')
+    op.drop_index('ix_prompt_category_order', table_name='prompt')
+    op.drop_index('ix_question_category_parent_id', table_name='question_category')
@@ -0,0 +1,32 @@
+"""unique refresh token user agent
+
+Revision ID: a7c3d5e9f214
+Revises: 6e1f0b8c3a57
+Create Date: 2026-10-18 17:20:09.441873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3d5e9f214'
+down_revision = '6e1f0b8c3a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('DELETE FROM refresh_token WHERE id IN ('
+               'SELECT id FROM (SELECT id, row_number() OVER ('
+               'PARTITION BY user_id, user_agent ORDER BY exp DESC) AS position FROM refresh_token) AS tokens '
+               'WHERE position > 1)')
+    op.drop_index('ix_refresh_token_user_agent', table_name='refresh_token')
+    op.create_index('ix_refresh_token_user_agent', 'refresh_token', ['user_id', 'user_agent'],
+                    unique=True, postgresql_include=['theme'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_refresh_token_user_agent', table_name='refresh_token')
+    op.create_index('ix_refresh_token_user_agent', 'refresh_token', ['user_id', 'user_agent'],
+                    postgresql_include=['theme'])
@@ -0,0 +1,24 @@
+"""entitlement version
+
+Revision ID: c81f5a3e7d90
+Revises: f3b8e1d4c6a2
+Create Date: 2026-10-18 21:14:08.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5a3e7d90'
+down_revision = 'f3b8e1d4c6a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('entitlement_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'entitlement_version')
@@ -0,0 +1,37 @@
+"""payment event inbox
+
+Revision ID: f3b8e1d4c6a2
+Revises: a7c3d5e9f214
+Create Date: 2026-10-18 18:03:51.672390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8e1d4c6a2'
+down_revision = 'a7c3d5e9f214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('payment_event',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('event_key', sa.String(), nullable=False),
+    sa.Column('event', sa.String(), nullable=False),
+    sa.Column('payload', sa.String(), nullable=False),
+    sa.Column('received_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('processed_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_key')
+    )
+    op.create_index('ix_payment_event_pending', 'payment_event', ['received_at'],
+                    postgresql_where=sa.text('processed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payment_event_pending', table_name='payment_event')
+    op.drop_table('payment_event')
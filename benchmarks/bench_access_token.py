@@ -0,0 +1,25 @@
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from auth.routes import generate_access_token
+from auth.verifier import AccessTokenVerifier
+from users.models import User
+
+NUMBER = 10000
+
+
+def measure(name, verify):
+    seconds = min(timeit.repeat(verify, number=NUMBER, repeat=5)) / NUMBER
+    print(f'{name:<10} {seconds * 1e6:7.2f} us/request')
+
+
+if __name__ == '__main__':
+    authorization = 'Bearer ' + generate_access_token(User(id=uuid.uuid4(), chat_id=1, name='bench_user'))
+    uncached = AccessTokenVerifier(cache_size=0)
+    cached = AccessTokenVerifier()
+    measure('uncached', lambda: uncached.verify(authorization))
+    measure('cached', lambda: cached.verify(authorization))
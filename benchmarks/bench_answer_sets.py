@@ -0,0 +1,81 @@
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from questions.answer_sets import map_answer_sets
+from questions.catalog import CatalogSnapshot
+from questions.schemas import AdminQuestion, FullOption, Option as OptionSchema, Question as QuestionSchema
+from utils import try_uuid
+
+INTERACTIONS = 1000
+QUESTIONS = 8
+OPTIONS = 5
+REPEAT = 5
+
+
+def map_interactions_old(interactions, user_id):
+    return list(map(lambda interaction: [QuestionSchema(
+        id=id,
+        question=interaction[5][i],
+        snippet=interaction[6][i],
+        options=[OptionSchema(id=uuid.UUID(hex=id), text=text)
+                 for id, text in zip(interaction[7][i].split('DEL'),
+                                     interaction[8][i].split('DEL'))]
+        if interaction[7][i] is not None else None,
+        answer=try_uuid(interaction[9][i])
+        if interaction[9][i] is not None and
+           len(interaction[9][i].split('DEL')) == 1 else None,
+        answers=list(map(try_uuid, interaction[9][i].split('DEL')))
+        if interaction[9][i] is not None and
+           len(interaction[9][i].split('DEL')) > 1 else None,
+        isRequired=interaction[10][i],
+        categoryId=interaction[11]
+    ) for i, id in enumerate(interaction[4])], interactions))
+
+
+def make_rows():
+    category_id = uuid.uuid4()
+    questions = [AdminQuestion(id=uuid.uuid4(),
+                               question=f'question {i}',
+                               snippet=None,
+                               isRequired=i % 2 == 0,
+                               categoryId=category_id,
+                               questionType='options' if i % 2 == 0 else 'text',
+                               orderIndex=i,
+                               options=[FullOption(id=uuid.uuid4(), text=f'option {j}', text_to_prompt=f'prompt {j}')
+                                        for j in range(OPTIONS)] if i % 2 == 0 else None)
+                 for i in range(QUESTIONS)]
+    snapshot = CatalogSnapshot(version=0, categories=[], questions=questions)
+
+    old_rows, new_rows = [], []
+    for _ in range(INTERACTIONS):
+        interaction_id = uuid.uuid4()
+        answers = [[question.options[0].id.hex] if question.options else ['text answer'] for question in questions]
+        old_rows.append((interaction_id, None, None, None,
+                         [question.id for question in questions],
+                         [question.question for question in questions],
+                         [question.snippet for question in questions],
+                         ['DEL'.join(str(option.id) for option in question.options) if question.options else None
+                          for question in questions],
+                         ['DEL'.join(option.text for option in question.options) if question.options else None
+                          for question in questions],
+                         ['DEL'.join(answer) for answer in answers],
+                         [question.isRequired for question in questions],
+                         category_id))
+        new_rows += [(interaction_id, question.id, answer) for question, answer in zip(questions, answers)]
+    return snapshot, old_rows, new_rows
+
+
+def measure(name, mapper):
+    seconds = min(timeit.repeat(mapper, number=1, repeat=REPEAT))
+    print(f'{name:<6} {seconds * 1e3:9.1f} ms per {INTERACTIONS} interactions')
+
+
+if __name__ == '__main__':
+    snapshot, old_rows, new_rows = make_rows()
+    print(f'{INTERACTIONS} interactions, {QUESTIONS} questions, {OPTIONS} options per options question')
+    measure('old', lambda: map_interactions_old(old_rows, uuid.uuid4()))
+    measure('new', lambda: map_answer_sets(new_rows, snapshot))
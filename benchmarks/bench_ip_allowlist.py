@@ -0,0 +1,26 @@
+import ipaddress
+import os
+import random
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from config import YOOKASSA_NETWORKS
+from ip_allowlist import IpRanges
+
+NUMBER = 100000
+
+
+def measure(name, check, hosts):
+    seconds = min(timeit.repeat(lambda: [check(host) for host in hosts], number=NUMBER // len(hosts), repeat=5))
+    print(f'{name:<10} {seconds / NUMBER * 1e6:7.3f} us/check')
+
+
+if __name__ == '__main__':
+    ranges = IpRanges(YOOKASSA_NETWORKS)
+    hosts = [str(network.network_address + random.randrange(network.num_addresses)) for network in YOOKASSA_NETWORKS]
+    hosts += [str(ipaddress.ip_address(random.getrandbits(32))) for _ in range(len(hosts))]
+
+    measure('any', lambda host: any([ipaddress.ip_address(host) in network for network in YOOKASSA_NETWORKS]), hosts)
+    measure('bisect', lambda host: ipaddress.ip_address(host) in ranges, hosts)
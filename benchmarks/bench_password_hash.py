@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from auth.models import Auth
+from auth.passwords import PasswordHasher
+
+LOGINS = 50
+COSTS = [('hmac-sha256', ''),
+         ('scrypt', 'n=16384,r=8,p=1'),
+         ('scrypt', 'n=32768,r=8,p=1'),
+         ('pbkdf2-sha256', 'iterations=600000')]
+
+
+async def measure(algorithm: str, params: str, workers: int):
+    hasher = PasswordHasher(algorithm=algorithm, params=params, max_workers=workers)
+    auth = Auth(algorithm=algorithm, params=params)
+    auth.password, auth.salt = await hasher.hash('password')
+
+    heartbeats = 0
+    async def heartbeat():
+        nonlocal heartbeats
+        while True:
+            await asyncio.sleep(0.01)
+            heartbeats += 1
+
+    task = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    assert all(await asyncio.gather(*[hasher.verify(auth, 'password') for _ in range(LOGINS)]))
+    seconds = time.perf_counter() - start
+    task.cancel()
+    hasher.executor.shutdown()
+    print(f'{algorithm:<14} {params:<20} workers={workers} {LOGINS / seconds:9.1f} logins/s '
+          f'loop ticks {heartbeats}/{int(seconds / 0.01)}')
+
+
+async def main():
+    for algorithm, params in COSTS:
+        for workers in (1, 4):
+            await measure(algorithm, params, workers)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+import os
+import sys
+import timeit
+import tracemalloc
+import uuid
+from itertools import product
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from questions.routers import map_question_rows
+
+QUESTIONS = 60
+OPTIONS = 6
+ANSWERS = 3
+REPEAT = 200
+
+
+def map_question_rows_old(questions):
+    return list(map(lambda q: (q[0],
+                               list(zip(*list(set(list(zip(q[1], q[3]))))))[0] if q[0].type_ == 'options' else q[1],
+                               list(filter(lambda opt: opt is not None, q[2])),
+                               list(zip(*list(set(list(zip(q[1], q[3]))))))[1] if q[0].type_ == 'options' else q[3],
+                               list(filter(lambda opt: opt is not None, q[4]))), questions))
+
+
+def make_rows():
+    old_rows, new_rows = [], []
+    for i in range(QUESTIONS):
+        is_options = i % 2 == 0
+        question = SimpleNamespace(id=uuid.uuid4(), type_='options' if is_options else 'text')
+        option_ids = [uuid.uuid4() for _ in range(OPTIONS)] if is_options else []
+        option_texts = [f'option {j}' for j in range(len(option_ids))]
+        answer_ids = [uuid.uuid4() for _ in range(ANSWERS if is_options else 1)]
+        answer_texts = [option_ids[j].hex for j in range(len(answer_ids))] if is_options else ['text answer']
+
+        # the old query joined answers with options, so every answer is repeated once per option
+        pairs = list(product(zip(answer_texts, answer_ids), zip(option_texts, option_ids))) if is_options \
+            else [((answer_texts[0], answer_ids[0]), (None, None))]
+        old_rows.append((question,
+                         [pair[0][0] for pair in pairs],
+                         [pair[1][0] for pair in pairs],
+                         [pair[0][1] for pair in pairs],
+                         [pair[1][1] for pair in pairs]))
+        new_rows.append((question, answer_texts, option_texts or None, answer_ids, option_ids or None))
+    return old_rows, new_rows
+
+
+def measure(name, mapper, rows):
+    seconds = min(timeit.repeat(lambda: mapper(rows), number=REPEAT, repeat=5)) / REPEAT
+    tracemalloc.start()
+    mapper(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<6} {seconds * 1e6:9.1f} us/request  {peak / 1024:8.1f} KiB peak')
+
+
+if __name__ == '__main__':
+    old_rows, new_rows = make_rows()
+    print(f'{QUESTIONS} questions, {OPTIONS} options, {ANSWERS} answers per options question')
+    measure('old', map_question_rows_old, old_rows)
+    measure('new', lambda rows: list(map_question_rows(rows)), new_rows)
@@ -0,0 +1,20 @@
+import os
+import uuid
+
+from locust import HttpUser, between, task
+
+USERNAME = os.environ.get('LOCUST_USERNAME', 'first_user')
+PASSWORD = os.environ.get('LOCUST_PASSWORD', '1234')
+
+
+class LoginUser(HttpUser):
+    wait_time = between(0, 0.1)
+
+    def on_start(self):
+        self.user_agent = f'locust-{uuid.uuid4()}'
+
+    @task
+    def login(self):
+        self.client.post('/auth/login',
+                         headers={'user-agent': self.user_agent},
+                         json={'username': USERNAME, 'password': PASSWORD})
@@ -1,35 +1,43 @@
 import uuid
+from datetime import datetime
 from typing import Callable
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select, func, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import aggregate_order_by
 
-from admin.schemas import AdminProductsResponse
-from admin.utils import get_products_
+from admin.schemas import AdminProductsResponse, CacheStatsResponse
 from auth.routes import get_admin_token
 from auth.utils import AccessTokenPayload
 from database import get_async_session
+from history.export import get_export_query, iter_interactions, export_ndjson, export_csv
 from history.schemas import UserHistory, UsersHistoryResponse
 from questions.routers import get_question_schemas, filled_prompt_generator, get_question_data
 from questions.schemas import AdminQuestion, AdminQuestionsResponse, FullOption, AdminCategoriesResponse, AdminCategory, \
     UnfilledPromptResponse, PromptResponse
 from questions.schemas import Prompt as PromptSchema
 from questions.schemas import Category as CategorySchema
-from questions.models import Prompt as PromptModel, Answer, Prompt
+from questions.catalog import CatalogSnapshot, get_catalog, refresh_catalog
+from questions.models import Prompt as PromptModel, Answer
 from questions.models import Question, Option
 from questions.models import Category as CategoryModel
 from users.models import User
+from payment.catalog import ProductCatalogSnapshot, get_product_catalog, refresh_product_catalog
 from payment.schemas import AdminProduct as AdminProductSchema
 from payment.models import ProductCategory
 from payment.models import Product as ProductModel
 from payment.models import PromoCode as PromoCodeModel
-from history.routers import get_history
+from questions.utils import gpt_cache
+from utils import with_etag
 
 router = APIRouter(prefix='/admin',
                    tags=['Admin'])
 
+EXPORT_FORMATS = {'ndjson': (export_ndjson, 'application/x-ndjson'),
+                  'csv': (export_csv, 'text/csv')}
+
 
 async def get_admin_categories(session: AsyncSession):
     categories = (await session.execute(
@@ -107,6 +115,7 @@ async def change_add_question(question: AdminQuestion,
             question_id=question.id,
             user_id=user.id) for user in (await session.execute(select(User))).scalars().all()])
 
+    await refresh_catalog(session)
     return await get_admin_questions(session, question.categoryId)
 
 @router.get('/prompt', dependencies=[Depends(get_admin_token)])
@@ -129,7 +138,7 @@ async def change_add_prompt(prompt: PromptSchema,
                                  category_id=prompt.categoryId,
                                  text=prompt_el,
                                  order_index=i) for i, prompt_el in enumerate(prompt.prompt)])
-    await session.flush()
+    await refresh_catalog(session)
     return await get_admin_categories(session)
 
 
@@ -154,7 +163,7 @@ async def add_change_category(category: CategorySchema,
         old_category.parent_id = category.parentId
         session.add(old_category)
 
-    await session.flush()
+    await refresh_catalog(session)
     return await get_admin_categories(session)
 
 @router.delete('/category', dependencies=[Depends(get_admin_token)])
@@ -162,7 +171,7 @@ async def delete_category(categoryId: uuid.UUID,
                           session: AsyncSession=Depends(get_async_session)) -> AdminCategoriesResponse:
     category = await session.get(CategoryModel, categoryId)
     await session.delete(category)
-    await session.flush()
+    await refresh_catalog(session)
     return await get_admin_categories(session)
 
 @router.delete('/question', dependencies=[Depends(get_admin_token)])
@@ -170,7 +179,7 @@ async def delete_question(questionId: uuid.UUID,
                           session: AsyncSession=Depends(get_async_session)) -> AdminQuestionsResponse:
     question = await session.get(Question, questionId)
     await session.delete(question)
-    await session.flush()
+    await refresh_catalog(session)
     return await get_admin_questions(session, question.category_id)
 
 @router.get('/questions', dependencies=[Depends(get_admin_token)])
@@ -182,6 +191,7 @@ async def get_questions(categoryId: uuid.UUID,
 async def get_prompt(categoryId: uuid.UUID,
                      user_token: AccessTokenPayload=Depends(get_admin_token),
                      session: AsyncSession=Depends(get_async_session),
+                     catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
                      get_filled_prompt: Callable=Depends(filled_prompt_generator)) -> PromptResponse :
     questions_data = await get_question_data(user_token.id, session, categoryId)
     questions = get_question_schemas(questions_data)
@@ -189,26 +199,47 @@ async def get_prompt(categoryId: uuid.UUID,
         if question.isRequired and not question.answers and not question.answer:
             raise HTTPException(status_code=400, detail='required fields not filled')
 
-    prompt = (await session.execute(select(Prompt.text)
-                                    .where(Prompt.category_id == categoryId)
-                                    .order_by(Prompt.order_index))).scalars().all()
+    prompt = catalog_snapshot.get_compiled_prompt(categoryId)
 
     filled_prompt = await get_filled_prompt(questions, prompt, session)
 
     return PromptResponse(message='status success', questions=questions, filledPrompt=filled_prompt)
 
 @router.get('/history', dependencies=[Depends(get_admin_token)])
-async def get_users_history(session: AsyncSession=Depends(get_async_session)):
-    users = (await session.execute(select(User))).scalars().all()
+async def get_users_history(catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
+                            session: AsyncSession=Depends(get_async_session)):
+    history = {user_id: [] for user_id in (await session.execute(select(User.id))).scalars().all()}
+    async for interaction in iter_interactions(session=session,
+                                               snapshot=catalog_snapshot,
+                                               query=get_export_query()):
+        history.setdefault(interaction.userId, []).append(interaction)
 
     return UsersHistoryResponse(
         message='status success',
-        data=[UserHistory(user_id=user.id,
-                           history=(await get_history(session=session,
-                                                      user_id=user.id)).data
-                           ) for user in users]
-    )  
-  
+        data=[UserHistory(user_id=user_id, history=interactions) for user_id, interactions in history.items()]
+    )
+
+@router.get('/historyExport', dependencies=[Depends(get_admin_token)])
+async def export_users_history(exportFormat: str='ndjson',
+                               dateFrom: datetime | None=None,
+                               dateTo: datetime | None=None,
+                               categoryId: uuid.UUID | None=None,
+                               catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
+                               session: AsyncSession=Depends(get_async_session)) -> StreamingResponse:
+    if (export_format := EXPORT_FORMATS.get(exportFormat)) is None:
+        raise HTTPException(status_code=422, detail='unsupported export format')
+
+    exporter, media_type = export_format
+    interactions = iter_interactions(session=session,
+                                     snapshot=catalog_snapshot,
+                                     query=get_export_query(date_from=dateFrom,
+                                                            date_to=dateTo,
+                                                            category_id=categoryId))
+
+    return StreamingResponse(exporter(interactions),
+                             media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="history.{exportFormat}"'})
+
 @router.post('/product', dependencies=[Depends(get_admin_token)])
 async def add_change_product(product: AdminProductSchema,
                              session: AsyncSession=Depends(get_async_session)) -> AdminProductsResponse:
@@ -255,16 +286,24 @@ async def add_change_product(product: AdminProductSchema,
         discount_percent=promo_code.discountPercent
     ) for promo_code in product.promoCodes])
 
-    return await get_products_(session=session)
+    return (await refresh_product_catalog(session)).admin_response
 
 
-@router.get('/product', dependencies=[Depends(get_admin_token)])
-async def get_products(session: AsyncSession=Depends(get_async_session)) -> AdminProductsResponse:
-    return await get_products_(session=session)
+@router.get('/product', dependencies=[Depends(get_admin_token)], responses={304: {'description': 'not modified'}})
+async def get_products(request: Request,
+                       response: Response,
+                       products: ProductCatalogSnapshot=Depends(get_product_catalog)) -> AdminProductsResponse:
+    return with_etag(request, response, products.admin_etag, products.admin_response)
 
 @router.delete('/product', dependencies=[Depends(get_admin_token)])
 async def delete_product(productId: uuid.UUID,
                          session: AsyncSession=Depends(get_async_session)) -> AdminProductsResponse:
     product = await session.get(ProductModel, productId)
     product.active = False
-    return await get_products_(session=session)
+    return (await refresh_product_catalog(session)).admin_response
+
+@router.get('/gptCache', dependencies=[Depends(get_admin_token)])
+async def get_gpt_cache_stats() -> CacheStatsResponse:
+    if gpt_cache is None:
+        return CacheStatsResponse(message='status success', enabled=False, hits=0, misses=0, size=0)
+    return CacheStatsResponse(message='status success', enabled=True, **(await gpt_cache.stats()))
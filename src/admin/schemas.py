@@ -6,3 +6,9 @@ class AdminProductsResponse(BaseResponse):
 
 class ProductsResponse(BaseResponse):
     data: list[Product]
+
+class CacheStatsResponse(BaseResponse):
+    enabled: bool
+    hits: int
+    misses: int
+    size: int
@@ -1,16 +1,18 @@
 from datetime import datetime
 import uuid
 
-from sqlalchemy import Column, LargeBinary, ForeignKey, UUID, TIMESTAMP, String
+from sqlalchemy import Column, LargeBinary, ForeignKey, UUID, TIMESTAMP, String, Index
 
 from users.models import Base
 
 class Auth(Base):
     __tablename__ = 'auth'
     id = Column(UUID, primary_key=True)
-    user_id = Column(ForeignKey('users.id', ondelete='cascade'), nullable=False)
+    user_id = Column(ForeignKey('users.id', ondelete='cascade'), nullable=False, index=True)
     password = Column(LargeBinary, nullable=False)
     salt = Column(LargeBinary, nullable=False)
+    algorithm = Column(String, nullable=False, default='hmac-sha256', server_default='hmac-sha256')
+    params = Column(String, nullable=False, default='', server_default='')
 
 
 
@@ -44,3 +46,7 @@ class RefreshToken(Base):
     exp = Column(TIMESTAMP, nullable=False)
     last_use = Column(TIMESTAMP)
     theme = Column(String, nullable=False, default='LIGHT_THEME')
+
+    __table_args__ = (
+        Index('ix_refresh_token_user_agent', 'user_id', 'user_agent', unique=True, postgresql_include=['theme']),
+    )
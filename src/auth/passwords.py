@@ -0,0 +1,58 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from auth.models import Auth
+from auth.utils import get_salted_password
+from config import SALT, PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_PARAMS, PASSWORD_HASH_WORKERS
+
+LEGACY_ALGORITHM = 'hmac-sha256'
+
+
+def parse_params(params: str) -> dict[str, int]:
+    return {name: int(value) for name, value in (param.split('=') for param in params.split(',') if param)}
+
+def derive_key(algorithm: str, params: str, password: bytes, salt: bytes) -> bytes:
+    if algorithm == LEGACY_ALGORITHM:
+        return get_salted_password(password=password, dynamic_salt=salt)
+    cost = parse_params(params)
+    if algorithm == 'scrypt':
+        return hashlib.scrypt(password, salt=salt + SALT, n=cost['n'], r=cost['r'], p=cost['p'],
+                              maxmem=256 * cost['n'] * cost['r'], dklen=32)
+    if algorithm == 'pbkdf2-sha256':
+        return hashlib.pbkdf2_hmac('sha256', password, salt + SALT, cost['iterations'])
+    raise ValueError(f'unknown password hash algorithm {algorithm}')
+
+
+class PasswordHasher:
+    def __init__(self,
+                 algorithm: str=PASSWORD_HASH_ALGORITHM,
+                 params: str=PASSWORD_HASH_PARAMS,
+                 max_workers: int=PASSWORD_HASH_WORKERS):
+        self.algorithm = algorithm
+        self.params = params
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hasher')
+
+    async def run(self, algorithm: str, params: str, password: str, salt: bytes) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, derive_key, algorithm, params, password.encode(), salt)
+
+    async def hash(self, password: str) -> tuple[bytes, bytes]:
+        salt = secrets.token_bytes(32)
+        return await self.run(self.algorithm, self.params, password, salt), salt
+
+    async def set_password(self, auth: Auth, password: str):
+        auth.password, auth.salt = await self.hash(password)
+        auth.algorithm = self.algorithm
+        auth.params = self.params
+
+    async def verify(self, auth: Auth, password: str) -> bool:
+        return hmac.compare_digest(await self.run(auth.algorithm, auth.params, password, auth.salt), auth.password)
+
+    def needs_rehash(self, auth: Auth) -> bool:
+        return auth.algorithm != self.algorithm or auth.params != self.params
+
+
+password_hasher = PasswordHasher()
@@ -1,77 +1,42 @@
 import binascii
-import uuid
 from datetime import datetime, timedelta
-import re
 
 from pydantic import ValidationError
 from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from sqlalchemy import select, and_, delete
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import REFRESH_TTL_DAYS, ACCESS_TTL_MINUTES
+from config import ACCESS_TTL_MINUTES
 from database import get_async_session
 from auth.schemas import Credentials, JwtTokens, UserSign, AccessTokenHeader, \
     RefreshTokenPayload, AccessTokenSchema, Passwords
-from auth.models import Auth, RefreshToken
+from auth.models import Auth
+from auth.token_store import RefreshTokenRecord, TokenStore, get_token_store
+from auth.verifier import access_token_verifier
 from users.models import User
 from users.utils import get_profile
 from users.schemas import NewUser, UserProfile
-from auth.utils import encrypt, base64_encode, AccessTokenPayload, base64_decode, check_user_agent, get_salted_password, \
-    generate_salted_password
+from auth.passwords import password_hasher
+from auth.utils import encrypt, base64_encode, AccessTokenPayload, base64_decode, check_user_agent
 from utils import BaseResponse
 
 router = APIRouter(prefix='/auth',
                    tags=['Auth'])
 
 async def get_access_token(Authorization: str = Header(...)) -> AccessTokenPayload:
-    base64_chars = r'[a-zA-Z0-9=_+-/]'
-    pattern = re.compile(rf'^Bearer {base64_chars}+\.{base64_chars}+\.{base64_chars}+$')
-
-    if pattern.match(Authorization) is None:
-        raise HTTPException(status_code=401, detail='user is not authorized')
-    header, payload, sign = Authorization.split('Bearer ')[1].split('.')
-    try:
-        decoded_sign = base64_decode(sign)
-        decoded_payload = base64_decode(payload)
-    except binascii.Error:
-        raise HTTPException(status_code=498, detail='the access token is invalid')
-
-    if not encrypt(header + '.' + payload) == decoded_sign:
-        raise HTTPException(status_code=498, detail='the access token is invalid')
-
-    user_token = AccessTokenPayload.parse_raw(decoded_payload)
-
-    if int(datetime.utcnow().timestamp()) > user_token.exp:
-        raise HTTPException(status_code=498, detail='the access token is invalid')
-
-    return user_token
+    return access_token_verifier.verify(Authorization)
 
 async def get_admin_token(user_token: AccessTokenPayload=Depends(get_access_token)) -> AccessTokenPayload:
     if user_token.role != 'admin':
         raise HTTPException(status_code=403, detail='User has to be admin')
     return user_token
 
-async def get_refresh_token(Authorization: str = Header(...),
-                            session: AsyncSession=Depends(get_async_session),
-                            user_agent: str=Depends(check_user_agent)) -> RefreshToken:
+async def get_refresh_token(Authorization: str = Header(...)) -> RefreshTokenPayload:
     try:
-        token=RefreshTokenPayload.parse_raw(base64_decode(Authorization.split('Bearer ')[1]))
+        return RefreshTokenPayload.parse_raw(base64_decode(Authorization.split('Bearer ')[1]))
     except (IndexError, ValueError, binascii.Error, ValidationError):
         raise HTTPException(status_code=498, detail='the refresh token is invalid')
 
-    db_token = (await session.execute(select(RefreshToken)
-                        .where(and_(RefreshToken.user_id == token.sub,
-                                    RefreshToken.user_agent == user_agent)))).scalars().first()
-
-    if db_token is None:
-        raise HTTPException(status_code=404, detail='refresh token not found')
-    if db_token.id != token.jti:
-        await session.delete(db_token)
-        await session.commit()
-        raise HTTPException(status_code=401, detail='the refresh token has already been used')
-
-    return db_token
-
 
 async def check_new_user(request: Request,
                          new_user: NewUser,
@@ -98,20 +63,8 @@ def generate_access_token(user: User) -> str:
     signed_access_token = access_token + '.' + signature
     return signed_access_token
 
-def get_new_tokens(user: User,
-                   user_agent: str,
-                   session: AsyncSession) -> JwtTokens:
-
-    refresh_token_id = uuid.uuid4()
-
-    session.add(RefreshToken(id=refresh_token_id,
-                             user_id=user.id,
-                             user_agent=user_agent,
-                             exp=datetime.utcnow() + timedelta(days=REFRESH_TTL_DAYS),
-                             last_use=datetime.utcnow()))
-    refresh_token = base64_encode(RefreshTokenPayload(jti=refresh_token_id, sub=user.id).json())
-
-    tokens = JwtTokens(refreshToken=refresh_token,
+def get_new_tokens(user: User, refresh_token: RefreshTokenRecord) -> JwtTokens:
+    tokens = JwtTokens(refreshToken=base64_encode(RefreshTokenPayload(jti=refresh_token.id, sub=user.id).json()),
                        accessToken=generate_access_token(user))
     return tokens
 
@@ -120,6 +73,7 @@ def get_new_tokens(user: User,
                                        401: {'model': BaseResponse, 'description': 'incorrect username and password'}})
 async def login(credentials: Credentials,
                 session: AsyncSession=Depends(get_async_session),
+                token_store: TokenStore=Depends(get_token_store),
                 user_agent: str=Depends(check_user_agent)) -> JwtTokens:
 
     user_auth = (await session.execute(select(User, Auth)
@@ -131,16 +85,12 @@ async def login(credentials: Credentials,
 
     user, auth = user_auth
 
-    if get_salted_password(password=credentials.password, dynamic_salt=auth.salt) != auth.password:
+    if not await password_hasher.verify(auth, credentials.password):
         raise HTTPException(status_code=401, detail='incorrect username and password')
+    if password_hasher.needs_rehash(auth):
+        await password_hasher.set_password(auth, credentials.password)
 
-
-    if token := (await session.execute(select(RefreshToken)
-                        .where(and_(RefreshToken.user_id==user.id,
-                                    RefreshToken.user_agent == user_agent)))).scalar():
-        await session.delete(token)
-
-    jwt_tokens = get_new_tokens(user, user_agent, session)
+    jwt_tokens = get_new_tokens(user, await token_store.issue(user.id, user_agent))
 
     return jwt_tokens
 
@@ -151,34 +101,26 @@ async def login(credentials: Credentials,
                                         498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
 async def logout(user_token: AccessTokenPayload=Depends(get_access_token),
                  user_agent: str=Depends(check_user_agent),
-                 session: AsyncSession=Depends(get_async_session)) -> BaseResponse:
+                 token_store: TokenStore=Depends(get_token_store)) -> BaseResponse:
 
-    refresh_tokens = (await session.execute(select(RefreshToken)
-                           .where(and_(RefreshToken.user_agent == user_agent,
-                                       RefreshToken.user_id == user_token.id)))).all()
-    if refresh_tokens == []:
-        await session.execute(delete(RefreshToken).filter(RefreshToken.id == user_token.id))
+    if not await token_store.revoke(user_token.id, user_agent):
         raise HTTPException(status_code=300, detail='user is blocked')
 
-    await session.execute(delete(RefreshToken)
-                          .where(and_(RefreshToken.user_agent == user_agent,
-                                      RefreshToken.user_id == user_token.id)))
-
     return BaseResponse(message='status success, user logged out')
 
 @router.get('/newTokens', responses={200: {'model': JwtTokens},
                                           401: {'model': BaseResponse, 'description': 'the refresh token has already been used'},
                                           404: {'model': BaseResponse, 'description': 'refresh token not found'},
                                           498: {'model': BaseResponse, 'description': 'the refresh token is invalid'}})
-async def give_new_tokens(refresh_token: RefreshToken=Depends(get_refresh_token),
-                          session: AsyncSession=Depends(get_async_session)) -> JwtTokens:
+async def give_new_tokens(refresh_token: RefreshTokenPayload=Depends(get_refresh_token),
+                          user_agent: str=Depends(check_user_agent),
+                          session: AsyncSession=Depends(get_async_session),
+                          token_store: TokenStore=Depends(get_token_store)) -> JwtTokens:
 
-    user = await session.get(User, refresh_token.user_id)
-    await session.delete(refresh_token)
+    new_refresh_token = await token_store.rotate(refresh_token.sub, user_agent, refresh_token.jti)
+    user = await session.get(User, refresh_token.sub)
 
-    new_tokens = get_new_tokens(user=user,
-                                user_agent=refresh_token.user_agent,
-                                session=session)
+    new_tokens = get_new_tokens(user=user, refresh_token=new_refresh_token)
 
     return new_tokens
 
@@ -187,16 +129,17 @@ async def give_new_tokens(refresh_token: RefreshToken=Depends(get_refresh_token)
                                                403: {'model': BaseResponse, 'description': 'refresh token expired'},
                                                404: {'model': BaseResponse, 'description': 'refresh token not found'},
                                                498: {'model': BaseResponse, 'description': 'the refresh token is invalid'}})
-async def get_new_access_token(refresh_token: RefreshToken=Depends(get_refresh_token),
-                           session: AsyncSession=Depends(get_async_session)) -> AccessTokenSchema:
-    if datetime.utcnow() > refresh_token.exp:
+async def get_new_access_token(refresh_token: RefreshTokenPayload=Depends(get_refresh_token),
+                               user_agent: str=Depends(check_user_agent),
+                               session: AsyncSession=Depends(get_async_session),
+                               token_store: TokenStore=Depends(get_token_store)) -> AccessTokenSchema:
+    stored_token = await token_store.verify(refresh_token.sub, user_agent, refresh_token.jti)
+    if datetime.utcnow() > stored_token.exp:
         raise HTTPException(status_code=403, detail='refresh token expired')
 
+    user = await session.get(User, refresh_token.sub)
 
-    user = await session.get(User, refresh_token.user_id)
-
-    refresh_token.last_use = datetime.utcnow()
-    session.add(refresh_token)
+    token_store.touch(stored_token)
 
     return AccessTokenSchema(access_token=generate_access_token(user))
 
@@ -208,17 +151,14 @@ async def get_new_access_token(refresh_token: RefreshToken=Depends(get_refresh_t
 async def change_password(passwords: Passwords,
                           user_agent: str=Depends(check_user_agent),
                           session: AsyncSession=Depends(get_async_session),
+                          token_store: TokenStore=Depends(get_token_store),
                           access_token: AccessTokenPayload=Depends(get_access_token)):
 
     auth = (await session.execute(select(Auth).where(Auth.user_id == access_token.id))).scalar()
 
-    if auth.password != get_salted_password(password=passwords.oldPassword, dynamic_salt=auth.salt):
+    if not await password_hasher.verify(auth, passwords.oldPassword):
         raise HTTPException(status_code=409, detail='Old password is wrong')
 
-    encrypted_password, salt = generate_salted_password(passwords.newPassword)
-
-    auth.password = encrypted_password
-    auth.salt = salt
-    session.add(auth)
+    await password_hasher.set_password(auth, passwords.newPassword)
 
-    return await get_profile(session, access_token.id, user_agent)
+    return await get_profile(session, token_store, access_token.id, user_agent)
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select, update, delete, and_, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from auth.models import RefreshToken
+from config import REDIS_URL, REFRESH_TOKEN_STORE, REFRESH_TTL_DAYS, LAST_USE_FLUSH_SECONDS
+from database import get_async_session, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenRecord(BaseModel):
+    id: uuid.UUID
+    user_id: uuid.UUID
+    user_agent: str
+    exp: datetime
+    last_use: datetime | None
+    theme: str = 'LIGHT_THEME'
+
+def new_record(user_id: uuid.UUID, user_agent: str, theme: str | None=None) -> RefreshTokenRecord:
+    now = datetime.utcnow()
+    return RefreshTokenRecord(id=uuid.uuid4(),
+                              user_id=user_id,
+                              user_agent=user_agent,
+                              exp=now + timedelta(days=REFRESH_TTL_DAYS),
+                              last_use=now,
+                              theme=theme if theme is not None else 'LIGHT_THEME')
+
+
+class TokenStore(ABC):
+    last_use: 'LastUseWriter'
+
+    @abstractmethod
+    async def get(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord | None:
+        ...
+
+    @abstractmethod
+    async def claim(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord | None:
+        ...
+
+    @abstractmethod
+    async def save(self, record: RefreshTokenRecord) -> RefreshTokenRecord:
+        ...
+
+    async def commit(self):
+        pass
+
+    async def check_claimed(self, claimed: RefreshTokenRecord | None, jti: uuid.UUID) -> RefreshTokenRecord:
+        if claimed is None:
+            raise HTTPException(status_code=404, detail='refresh token not found')
+        if claimed.id != jti:
+            await self.commit()
+            raise HTTPException(status_code=401, detail='the refresh token has already been used')
+        return claimed
+
+    async def issue(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord:
+        old = await self.claim(user_id, user_agent)
+        return await self.save(new_record(user_id, user_agent, old.theme if old is not None else None))
+
+    async def rotate(self, user_id: uuid.UUID, user_agent: str, jti: uuid.UUID) -> RefreshTokenRecord:
+        old = await self.check_claimed(await self.claim(user_id, user_agent), jti)
+        return await self.save(new_record(user_id, user_agent, old.theme))
+
+    async def verify(self, user_id: uuid.UUID, user_agent: str, jti: uuid.UUID) -> RefreshTokenRecord:
+        record = await self.get(user_id, user_agent)
+        if record is not None and record.id != jti:
+            await self.claim(user_id, user_agent)
+        return await self.check_claimed(record, jti)
+
+    async def revoke(self, user_id: uuid.UUID, user_agent: str) -> bool:
+        return await self.claim(user_id, user_agent) is not None
+
+    def touch(self, record: RefreshTokenRecord):
+        self.last_use.add(record)
+
+
+class PostgresTokenStore(TokenStore):
+    table = RefreshToken.__table__
+
+    def __init__(self, session: AsyncSession, last_use: 'LastUseWriter'):
+        self.session = session
+        self.last_use = last_use
+
+    def where(self, user_id: uuid.UUID, user_agent: str):
+        return and_(self.table.c.user_id == user_id, self.table.c.user_agent == user_agent)
+
+    async def get(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord | None:
+        row = (await self.session.execute(select(self.table).where(self.where(user_id, user_agent)))).first()
+        return RefreshTokenRecord(**row._mapping) if row is not None else None
+
+    async def claim(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord | None:
+        row = (await self.session.execute(
+            delete(self.table).where(self.where(user_id, user_agent)).returning(*self.table.c)
+        )).first()
+        return RefreshTokenRecord(**row._mapping) if row is not None else None
+
+    async def save(self, record: RefreshTokenRecord) -> RefreshTokenRecord:
+        await self.session.execute(insert(self.table).values(**record.dict()))
+        return record
+
+    async def issue(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord:
+        record = new_record(user_id, user_agent)
+        statement = insert(self.table).values(**record.dict())
+        row = (await self.session.execute(
+            statement
+            .on_conflict_do_update(index_elements=[self.table.c.user_id, self.table.c.user_agent],
+                                   set_={'id': statement.excluded.id,
+                                         'exp': statement.excluded.exp,
+                                         'last_use': statement.excluded.last_use})
+            .returning(*self.table.c)
+        )).first()
+        return RefreshTokenRecord(**row._mapping)
+
+    async def commit(self):
+        await self.session.commit()
+
+    async def revoke_user(self, user_id: uuid.UUID):
+        await self.session.execute(delete(self.table).where(self.table.c.user_id == user_id))
+
+    async def set_theme(self, user_id: uuid.UUID, user_agent: str, theme: str):
+        await self.session.execute(update(self.table).where(self.where(user_id, user_agent)).values(theme=theme))
+
+    @classmethod
+    async def write_last_use(cls, session_maker: sessionmaker, pending: list[RefreshTokenRecord]):
+        async with session_maker.begin() as session:
+            await session.execute(update(cls.table)
+                                  .where(cls.table.c.id == bindparam('token_id'))
+                                  .values(last_use=bindparam('token_last_use')),
+                                  [{'token_id': record.id, 'token_last_use': record.last_use} for record in pending])
+
+
+class RedisTokenStore(TokenStore):
+    def __init__(self, redis_client: redis.Redis, last_use: 'LastUseWriter', prefix: str='refresh:'):
+        self.redis = redis_client
+        self.last_use = last_use
+        self.prefix = prefix
+
+    def key(self, user_id: uuid.UUID, user_agent: str) -> str:
+        return f'{self.prefix}{user_id}:{user_agent}'
+
+    async def get(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord | None:
+        value = await self.redis.get(self.key(user_id, user_agent))
+        return RefreshTokenRecord.parse_raw(value) if value is not None else None
+
+    async def claim(self, user_id: uuid.UUID, user_agent: str) -> RefreshTokenRecord | None:
+        value = await self.redis.getdel(self.key(user_id, user_agent))
+        return RefreshTokenRecord.parse_raw(value) if value is not None else None
+
+    async def save(self, record: RefreshTokenRecord) -> RefreshTokenRecord:
+        await self.redis.set(self.key(record.user_id, record.user_agent),
+                             record.json(),
+                             ex=max(1, int((record.exp - datetime.utcnow()).total_seconds())))
+        return record
+
+    async def revoke(self, user_id: uuid.UUID, user_agent: str) -> bool:
+        return bool(await self.redis.delete(self.key(user_id, user_agent)))
+
+    async def revoke_user(self, user_id: uuid.UUID):
+        keys = [key async for key in self.redis.scan_iter(match=f'{self.prefix}{user_id}:*')]
+        if keys:
+            await self.redis.delete(*keys)
+
+    async def set_theme(self, user_id: uuid.UUID, user_agent: str, theme: str):
+        if (record := await self.get(user_id, user_agent)) is not None:
+            record.theme = theme
+            await self.save(record)
+
+    async def write_last_use(self, pending: list[RefreshTokenRecord]):
+        for record in pending:
+            key = self.key(record.user_id, record.user_agent)
+
+            async def set_last_use(pipe, record: RefreshTokenRecord=record, key: str=key):
+                value = await pipe.get(key)
+                stored = RefreshTokenRecord.parse_raw(value) if value is not None else None
+                if stored is None or stored.id != record.id:
+                    return
+                stored.last_use = record.last_use
+                pipe.multi()
+                pipe.set(key, stored.json(), keepttl=True)
+
+            await self.redis.transaction(set_last_use, key)
+
+
+class LastUseWriter:
+    def __init__(self, interval: float=LAST_USE_FLUSH_SECONDS):
+        self.interval = interval
+        self.pending: dict[uuid.UUID, RefreshTokenRecord] = {}
+        self.task: asyncio.Task | None = None
+
+    def add(self, record: RefreshTokenRecord):
+        record.last_use = datetime.utcnow()
+        self.pending[record.id] = record
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            if redis_client is not None:
+                await RedisTokenStore(redis_client, self).write_last_use(list(pending.values()))
+            else:
+                await PostgresTokenStore.write_last_use(async_session_maker, list(pending.values()))
+        except Exception:
+            self.pending = pending | self.pending
+            raise
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('failed to write refresh token last use, retrying in %s s', self.interval)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+
+redis_client = redis.from_url(REDIS_URL, decode_responses=True) if REFRESH_TOKEN_STORE == 'redis' else None
+last_use_writer = LastUseWriter()
+
+def get_session_token_store(session: AsyncSession) -> PostgresTokenStore | RedisTokenStore:
+    if redis_client is not None:
+        return RedisTokenStore(redis_client, last_use_writer)
+    return PostgresTokenStore(session, last_use_writer)
+
+def get_token_store(session: AsyncSession=Depends(get_async_session)) -> PostgresTokenStore | RedisTokenStore:
+    return get_session_token_store(session)
@@ -19,6 +19,9 @@ class AccessTokenPayload(BaseModel):
     tillDate: int | None
     exp: int
 
+    class Config:
+        allow_mutation = False
+
 
 async def check_user_agent(user_agent: str = Header(...)):
     if user_agent is None:
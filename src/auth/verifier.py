@@ -0,0 +1,47 @@
+import binascii
+import hmac
+import re
+from datetime import datetime
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from auth.utils import AccessTokenPayload, base64_decode, encrypt
+from cache import LRUCache
+from config import ACCESS_TOKEN_CACHE_SIZE
+
+BASE64_CHARS = r'[A-Za-z0-9_=+/-]'
+ACCESS_TOKEN_PATTERN = re.compile(rf'^Bearer ({BASE64_CHARS}+)\.({BASE64_CHARS}+)\.({BASE64_CHARS}+)$')
+
+
+class AccessTokenVerifier:
+    def __init__(self, cache_size: int=ACCESS_TOKEN_CACHE_SIZE):
+        self.cache = LRUCache(maxsize=cache_size)
+
+    def verify(self, authorization: str) -> AccessTokenPayload:
+        if (match := ACCESS_TOKEN_PATTERN.match(authorization)) is None:
+            raise HTTPException(status_code=401, detail='user is not authorized')
+
+        now = datetime.utcnow().timestamp()
+        if (user_token := self.cache.get(authorization)) is not None:
+            if int(now) > user_token.exp:
+                raise HTTPException(status_code=498, detail='the access token is invalid')
+            return user_token
+
+        header, payload, sign = match.groups()
+        try:
+            decoded_sign = base64_decode(sign)
+            if not hmac.compare_digest(encrypt(header + '.' + payload), decoded_sign):
+                raise HTTPException(status_code=498, detail='the access token is invalid')
+            user_token = AccessTokenPayload.parse_raw(base64_decode(payload))
+        except (binascii.Error, ValueError, ValidationError):
+            raise HTTPException(status_code=498, detail='the access token is invalid')
+
+        if int(now) > user_token.exp:
+            raise HTTPException(status_code=498, detail='the access token is invalid')
+
+        self.cache.set(authorization, user_token, ttl=user_token.exp - now)
+        return user_token
+
+
+access_token_verifier = AccessTokenVerifier()
@@ -4,11 +4,13 @@ import random
 import string
 from datetime import timedelta, datetime
 
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update
 
 import bot.config_ as CONSTS
-from auth.models import Auth, RefreshToken
-from auth.utils import encrypt, generate_salted_password
+from auth.models import Auth
+from auth.token_store import get_session_token_store
+from auth.passwords import password_hasher
+from auth.utils import encrypt
 from database import async_session_maker
 from payment.models import Purchase, Product
 from users.models import User
@@ -29,12 +31,14 @@ async def add_user(chat_id: int):
                              name=name))
             await session.flush()
 
-            encrypted_password, salt = generate_salted_password(password)
+            encrypted_password, salt = await password_hasher.hash(password)
 
             session.add(Auth(id=uuid.uuid4(),
                              user_id=user_id,
                              password=encrypted_password,
-                             salt=salt))
+                             salt=salt,
+                             algorithm=password_hasher.algorithm,
+                             params=password_hasher.params))
 
             questions = (await session.execute(select(Question))).scalars().all()
             session.add_all([Answer(id=uuid.uuid4(),
@@ -48,11 +52,14 @@ async def add_user(chat_id: int):
 
         else:
 
-            encrypted_password, salt = generate_salted_password(password)
+            encrypted_password, salt = await password_hasher.hash(password)
 
             name = user.name
-            await session.execute(update(Auth).where(Auth.user_id == user.id).values(password=encrypted_password, salt=salt,))
-            await session.execute(delete(RefreshToken).where(RefreshToken.user_id == user.id))
+            await session.execute(update(Auth).where(Auth.user_id == user.id).values(password=encrypted_password,
+                                                                                     salt=salt,
+                                                                                     algorithm=password_hasher.algorithm,
+                                                                                     params=password_hasher.params))
+            await get_session_token_store(session).revoke_user(user.id)
 
     return name, password
 
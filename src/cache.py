@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import redis.asyncio as redis
+
+from config import REDIS_URL, INVALIDATION_BUS_ON
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float | None=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        entry = self.data.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class MemoryCache:
+    def __init__(self, maxsize: int, ttl: float | None=None):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> str | None:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: str):
+        self.cache.set(key, value)
+
+    async def stats(self) -> dict[str, int]:
+        return {'hits': self.cache.hits, 'misses': self.cache.misses, 'size': len(self.cache)}
+
+
+class RedisCache:
+    def __init__(self, url: str, maxsize: int, ttl: float | None=None, prefix: str=''):
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.maxsize = maxsize
+        self.ttl = int(ttl) if ttl is not None else None
+        self.prefix = prefix
+        self.index_key = prefix + 'index'
+        self.stats_key = prefix + 'stats'
+
+    async def get(self, key: str) -> str | None:
+        value = await self.redis.get(self.prefix + key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if value is not None:
+                pipe.zadd(self.index_key, {key: time.time()})
+            pipe.hincrby(self.stats_key, 'hits' if value is not None else 'misses', 1)
+            await pipe.execute()
+        return value
+
+    async def set(self, key: str, value: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefix + key, value, ex=self.ttl)
+            pipe.zadd(self.index_key, {key: time.time()})
+            pipe.zcard(self.index_key)
+            size = (await pipe.execute())[-1]
+        if size > self.maxsize:
+            evicted = await self.redis.zrange(self.index_key, 0, size - self.maxsize - 1)
+            if evicted:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(*[self.prefix + evicted_key for evicted_key in evicted])
+                    pipe.zrem(self.index_key, *evicted)
+                    await pipe.execute()
+
+    async def stats(self) -> dict[str, int]:
+        stats = await self.redis.hgetall(self.stats_key)
+        return {'hits': int(stats.get('hits', 0)),
+                'misses': int(stats.get('misses', 0)),
+                'size': await self.redis.zcard(self.index_key)}
+
+
+def make_cache(backend: str | None,
+               maxsize: int,
+               ttl: float | None=None,
+               prefix: str='',
+               url: str | None=None) -> MemoryCache | RedisCache | None:
+    if backend == 'memory':
+        return MemoryCache(maxsize=maxsize, ttl=ttl)
+    if backend == 'redis':
+        return RedisCache(url=url, maxsize=maxsize, ttl=ttl, prefix=prefix)
+    return None
+
+
+class InvalidationBus:
+    def __init__(self, url: str | None, channel: str='invalidation'):
+        self.redis = redis.from_url(url, decode_responses=True) if url is not None else None
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self.handlers: dict[str, list[Callable[[], Any]]] = {}
+        self.task: asyncio.Task | None = None
+
+    def subscribe(self, name: str, handler: Callable[[], Any]):
+        self.handlers.setdefault(name, []).append(handler)
+
+    def notify(self, name: str):
+        for handler in self.handlers.get(name, []):
+            handler()
+
+    async def publish(self, name: str):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(self.channel, f'{self.instance_id}:{name}')
+        except redis.ConnectionError:
+            logger.warning('invalidation bus is unavailable, %s will expire by ttl', name)
+
+    async def listen(self):
+        reconnect = False
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                if reconnect:
+                    for name in self.handlers:
+                        self.notify(name)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    instance_id, name = message['data'].split(':', 1)
+                    if instance_id != self.instance_id:
+                        self.notify(name)
+            except redis.ConnectionError:
+                reconnect = True
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.reset()
+
+    def start(self):
+        if self.redis is None:
+            logger.warning('invalidation bus is off, caches are invalidated in this process only')
+        elif self.task is None:
+            self.task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+invalidation_bus = InvalidationBus(REDIS_URL if INVALIDATION_BUS_ON else None)
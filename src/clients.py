@@ -0,0 +1,44 @@
+import httpx
+
+from config import HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, HTTP2_ON, OPENAI_TIMEOUT_SECONDS, \
+    YOOKASSA_TIMEOUT_SECONDS
+
+
+class HttpClients:
+    def __init__(self,
+                 max_connections: int=HTTP_POOL_MAX_CONNECTIONS,
+                 max_keepalive_connections: int=HTTP_POOL_MAX_KEEPALIVE,
+                 http2: bool=HTTP2_ON):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections)
+        self.http2 = http2
+        self.timeouts = {'openai': httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=10),
+                         'yookassa': httpx.Timeout(YOOKASSA_TIMEOUT_SECONDS, connect=10)}
+        self.clients: dict[str, httpx.AsyncClient] = {}
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        client = self.clients.get(upstream)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self.limits,
+                                       http2=self.http2,
+                                       timeout=self.timeouts[upstream])
+            self.clients[upstream] = client
+        return client
+
+    async def start(self):
+        for upstream in self.timeouts:
+            self.get(upstream)
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+http_clients = HttpClients()
+
+def get_openai_client() -> httpx.AsyncClient:
+    return http_clients.get('openai')
+
+def get_yookassa_client() -> httpx.AsyncClient:
+    return http_clients.get('yookassa')
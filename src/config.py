@@ -30,6 +30,35 @@ SHOP_KEY = os.environ.get('SHOP_KEY')
 
 ORIGINS = os.environ.get('ORIGINS').split(' ')
 
+HTTP_POOL_MAX_CONNECTIONS = int(os.environ.get('HTTP_POOL_MAX_CONNECTIONS', 100))
+HTTP_POOL_MAX_KEEPALIVE = int(os.environ.get('HTTP_POOL_MAX_KEEPALIVE', 20))
+HTTP2_ON = bool(int(os.environ.get('HTTP2_ON', 1)))
+OPENAI_TIMEOUT_SECONDS = int(os.environ.get('OPENAI_TIMEOUT_SECONDS', 300))
+YOOKASSA_TIMEOUT_SECONDS = int(os.environ.get('YOOKASSA_TIMEOUT_SECONDS', 30))
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+INVALIDATION_BUS_ON = bool(int(os.environ.get('INVALIDATION_BUS_ON', int('REDIS_URL' in os.environ))))
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', REDIS_URL)
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CATALOG_TTL_SECONDS = int(os.environ.get('CATALOG_TTL_SECONDS', 60))
+PRODUCT_CATALOG_TTL_SECONDS = int(os.environ.get('PRODUCT_CATALOG_TTL_SECONDS', 10))
+
+GPT_CACHE_BACKEND = os.environ.get('GPT_CACHE_BACKEND')
+GPT_CACHE_SIZE = int(os.environ.get('GPT_CACHE_SIZE', 1000))
+GPT_CACHE_TTL_SECONDS = int(os.environ.get('GPT_CACHE_TTL_SECONDS', 24 * 60 * 60))
+
+REFRESH_TOKEN_STORE = os.environ.get('REFRESH_TOKEN_STORE', 'postgres')
+LAST_USE_FLUSH_SECONDS = int(os.environ.get('LAST_USE_FLUSH_SECONDS', 30))
+
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt')
+PASSWORD_HASH_PARAMS = os.environ.get('PASSWORD_HASH_PARAMS', 'n=16384,r=8,p=1')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+
+ACCESS_TOKEN_CACHE_SIZE = int(os.environ.get('ACCESS_TOKEN_CACHE_SIZE', 10000))
+
+ENTITLEMENT_CACHE_SIZE = int(os.environ.get('ENTITLEMENT_CACHE_SIZE', 10000))
+ENTITLEMENT_CACHE_TTL_SECONDS = int(os.environ.get('ENTITLEMENT_CACHE_TTL_SECONDS', 5 * 60))
+
 REFRESH_TTL_DAYS = 30
 ACCESS_TTL_MINUTES = 15
 
@@ -44,5 +73,7 @@ YOOKASSA_NETWORKS = [
     ipaddress.ip_network('77.75.156.11'),
     ipaddress.ip_network('77.75.156.35'),
 ]
+TRUSTED_PROXIES = [ipaddress.ip_network(network) for network in os.environ.get('TRUSTED_PROXIES', '').split()]
 
-PAYWALL_ON = bool(int(os.environ.get('PAYWALL_ON')))
\ No newline at end of file
+PAYWALL_ON = bool(int(os.environ.get('PAYWALL_ON')))
+PAYWALL_RESERVE_SYMBOLS = int(os.environ.get('PAYWALL_RESERVE_SYMBOLS', 4000))
\ No newline at end of file
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator
+
+from sqlalchemy import select, and_, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from history.models import GptInteraction as GptInteractionModel
+from history.schemas import GptInteraction as GptInteractionSchema
+from questions.answer_sets import aggregate_answers, get_question_schema
+from questions.catalog import CatalogSnapshot
+from questions.models import Answer
+from questions.models import Question as QuestionModel
+
+EXPORT_BATCH_SIZE = 500
+CSV_COLUMNS = ['interactionId', 'userId', 'dateTime', 'isFavorite', 'categoryId',
+               'questionId', 'question', 'answers', 'gptResponse']
+
+def get_export_query(date_from: datetime | None=None,
+                     date_to: datetime | None=None,
+                     category_id: uuid.UUID | None=None) -> Select:
+    return (select(GptInteractionModel.id,
+                   Answer.user_id,
+                   GptInteractionModel.time_happened,
+                   GptInteractionModel.response,
+                   GptInteractionModel.is_favorite,
+                   Answer.question_id,
+                   aggregate_answers())
+            .join(Answer, Answer.interaction_id == GptInteractionModel.id)
+            .join(QuestionModel)
+            .where(and_(GptInteractionModel.time_happened >= date_from if date_from is not None else True,
+                        GptInteractionModel.time_happened < date_to if date_to is not None else True,
+                        QuestionModel.category_id == category_id if category_id is not None else True))
+            .group_by(GptInteractionModel.id, Answer.user_id, Answer.question_id, QuestionModel.order_index)
+            .order_by(GptInteractionModel.time_happened, GptInteractionModel.id, QuestionModel.order_index)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+async def iter_interactions(session: AsyncSession,
+                            snapshot: CatalogSnapshot,
+                            query: Select) -> AsyncIterator[GptInteractionSchema]:
+    interaction = None
+    async for id, user_id, time_happened, response, is_favorite, question_id, answers in await session.stream(query):
+        if interaction is None or interaction.id != id:
+            if interaction is not None:
+                yield interaction
+            interaction = GptInteractionSchema.construct(id=id,
+                                                         userId=user_id,
+                                                         dateTime=time_happened,
+                                                         gptResponse=response,
+                                                         isFavorite=is_favorite,
+                                                         questions=[])
+        if (question := get_question_schema(snapshot, question_id, answers)) is not None:
+            interaction.questions.append(question)
+    if interaction is not None:
+        yield interaction
+
+async def export_ndjson(interactions: AsyncIterator[GptInteractionSchema]) -> AsyncIterator[str]:
+    async for interaction in interactions:
+        yield interaction.json() + '\n'
+
+async def export_csv(interactions: AsyncIterator[GptInteractionSchema]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    async for interaction in interactions:
+        for question in interaction.questions:
+            answers = question.answers if question.answers is not None else \
+                [question.answer] if question.answer is not None else []
+            writer.writerow([interaction.id,
+                             interaction.userId,
+                             interaction.dateTime.isoformat(),
+                             interaction.isFavorite,
+                             question.categoryId,
+                             question.id,
+                             question.question,
+                             json.dumps([str(answer) for answer in answers], ensure_ascii=False),
+                             interaction.gptResponse])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
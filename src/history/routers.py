@@ -1,100 +1,130 @@
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, func, text, literal_column
-from sqlalchemy.dialects.postgresql import aggregate_order_by
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, update, and_, or_, Select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.routes import get_access_token
 from auth.utils import AccessTokenPayload
 from database import get_async_session
-from history.schemas import GptInteraction as GptInteractionSchema, HistoryResponse
+from history.schemas import GptInteraction as GptInteractionSchema, HistoryResponse, HistoryPageResponse, \
+    GptInteractionSummary, GptInteractionResponse, FavoriteResponse, FavoriteInteraction
 from history.models import GptInteraction as GptInteractionModel
-from questions.models import Answer, Option
+from questions.answer_sets import get_answer_sets
+from questions.catalog import catalog
+from questions.models import Answer
 from questions.models import Question as QuestionModel
-from questions.schemas import Question as QuestionSchema
-from questions.schemas import Option as OptionShema
-from utils import BaseResponse, IdSchema, try_uuid
+from utils import BaseResponse, IdSchema, Cursor, encode_cursor, decode_cursor
 
 router = APIRouter(prefix='/history',
                    tags=['History'])
 
-async def get_history(session: AsyncSession, user_id: uuid.UUID, category_id: uuid.UUID=None) -> HistoryResponse:
-    interactions = (await session.execute(
-        select(text('id'),
-               text('time_happened'),
-               text('response'),
-               text('is_favorite'),
-               text('array_agg(id_1)'),
-               text('array_agg(question_text)'),
-               text('array_agg(snippet)'),
-               text('array_agg(option_ids)'),
-               text('array_agg(option_texts)'),
-               text('array_agg(question_answers)'),
-               text('array_agg(is_required)'),
-               text('category_id'))
-        .select_from(select(GptInteractionModel,
-                            QuestionModel,
-                            func.string_agg(Answer.text.distinct(), 'DEL').label('question_answers'),
-                            func.string_agg(text('option.id::text'), aggregate_order_by(literal_column("'DEL'"), Option.option_text)).label('option_ids'),
-                            func.string_agg(Option.option_text.distinct(), aggregate_order_by(literal_column("'DEL'"), Option.option_text)).label('option_texts'))
-                     .join(Answer)
-                     .join(QuestionModel)
-                     .join(Option, isouter=True)
-                     .where(Answer.user_id == user_id)
-                     .group_by(QuestionModel.id)
-                     .group_by(GptInteractionModel.id)
-                     .select_from(GptInteractionModel)
-                     .subquery(name='interaction'))
-        .where(text(f"interaction.category_id = '{category_id}'") if category_id is not None else True)
-        .group_by(text('(interaction.id)'))
-        .group_by(text('interaction.time_happened'))
-        .group_by(text('interaction.response'))
-        .group_by(text('interaction.is_favorite'))
-        .group_by(text('interaction.category_id')))).all()
-
-    interactions = list(map(lambda interaction:
-                            GptInteractionSchema(id=interaction[0],
-                                                 userId=user_id,
-                                                 dateTime=interaction[1],
-                                                 gptResponse=interaction[2],
-                                                 isFavorite=interaction[3],
-                                                 questions=[QuestionSchema(
-                                                     id=id,
-                                                     question=interaction[5][i],
-                                                     snippet=interaction[6][i],
-                                                     options=[OptionShema(id=uuid.UUID(hex=id),text=text)
-                                                              for id, text in zip(interaction[7][i].split('DEL'),
-                                                                                  interaction[8][i].split('DEL'))]
-                                                     if interaction[7][i] is not None else None,
-                                                     answer=try_uuid(interaction[9][i])
-                                                     if interaction[9][i] is not None and
-                                                        len(interaction[9][i].split('DEL')) == 1 else None,
-                                                     answers=list(map(try_uuid, interaction[9][i].split('DEL')))
-                                                     if interaction[9][i] is not None and
-                                                        len(interaction[9][i].split('DEL')) > 1 else None,
-                                                     isRequired=interaction[10][i],
-                                                     categoryId=interaction[11]
-                                                 ) for i, id in enumerate(interaction[4])]), interactions))
-
-    return HistoryResponse(message='status success', data=interactions)
+PREVIEW_LENGTH = 200
+
+def get_interactions_query(user_id: uuid.UUID,
+                           category_id: uuid.UUID | None=None,
+                           favorites: bool=False) -> Select:
+    return (select(GptInteractionModel)
+            .where(GptInteractionModel.id.in_(select(Answer.interaction_id)
+                                              .join(QuestionModel)
+                                              .where(and_(Answer.user_id == user_id,
+                                                          QuestionModel.category_id == category_id
+                                                          if category_id is not None else True))))
+            .where(GptInteractionModel.is_favorite if favorites else True)
+            .order_by(GptInteractionModel.time_happened.desc(), GptInteractionModel.id.desc()))
+
+async def get_interaction_schemas(session: AsyncSession,
+                                  user_id: uuid.UUID,
+                                  interactions: list[GptInteractionModel]) -> list[GptInteractionSchema]:
+    answer_sets = await get_answer_sets(session=session,
+                                        snapshot=await catalog.get(session),
+                                        parent_key=Answer.interaction_id,
+                                        user_id=user_id,
+                                        parent_ids=[interaction.id for interaction in interactions])
+
+    return [GptInteractionSchema(id=interaction.id,
+                                 userId=user_id,
+                                 dateTime=interaction.time_happened,
+                                 gptResponse=interaction.response,
+                                 isFavorite=interaction.is_favorite,
+                                 questions=answer_sets[interaction.id])
+            for interaction in interactions if interaction.id in answer_sets]
+
+async def get_history(session: AsyncSession,
+                      user_id: uuid.UUID,
+                      category_id: uuid.UUID=None,
+                      interaction_ids: list[uuid.UUID]=None) -> HistoryResponse:
+    query = get_interactions_query(user_id, category_id)
+    if interaction_ids is not None:
+        query = query.where(GptInteractionModel.id.in_(interaction_ids))
+
+    return HistoryResponse(message='status success',
+                           data=await get_interaction_schemas(session=session,
+                                                              user_id=user_id,
+                                                              interactions=(await session.execute(query)).scalars().all()))
+
+async def get_history_page(session: AsyncSession,
+                           user_id: uuid.UUID,
+                           category_id: uuid.UUID,
+                           cursor: str | None,
+                           limit: int,
+                           summary: bool,
+                           favorites: bool=False) -> HistoryPageResponse:
+    query = get_interactions_query(user_id, category_id, favorites)
+    if cursor is not None:
+        cursor = decode_cursor(cursor)
+        query = query.where(or_(GptInteractionModel.time_happened < cursor.time,
+                                and_(GptInteractionModel.time_happened == cursor.time,
+                                     GptInteractionModel.id < cursor.id)))
+
+    interactions = (await session.execute(query.limit(limit + 1))).scalars().all()
+
+    next_cursor = encode_cursor(Cursor(time=interactions[limit - 1].time_happened, id=interactions[limit - 1].id)) \
+        if len(interactions) > limit else None
+    interactions = interactions[:limit]
+
+    if summary:
+        data = [GptInteractionSummary(id=interaction.id,
+                                      categoryId=category_id,
+                                      dateTime=interaction.time_happened,
+                                      preview=interaction.response[:PREVIEW_LENGTH],
+                                      isFavorite=interaction.is_favorite)
+                for interaction in interactions]
+    else:
+        data = await get_interaction_schemas(session=session, user_id=user_id, interactions=interactions)
+
+    return HistoryPageResponse(message='status success', data=data, nextCursor=next_cursor)
 
 async def switch_favorite(session: AsyncSession,
                           user_id: uuid.UUID,
                           interaction_id: uuid.UUID,
-                          to_favorite: bool = True) -> HistoryResponse:
-    if (interaction := await session.get(GptInteractionModel, interaction_id)) is None:
-        raise HTTPException(status_code=404, detail='History entity with this id doesnt exist')
+                          to_favorite: bool = True,
+                          compact: bool = False) -> HistoryResponse | FavoriteResponse:
+    interactions = GptInteractionModel.__table__
+    interaction = (await session.execute(
+        update(interactions)
+        .where(and_(interactions.c.id == interaction_id,
+                    interactions.c.id.in_(select(Answer.interaction_id)
+                                          .where(and_(Answer.interaction_id == interaction_id,
+                                                      Answer.user_id == user_id)))))
+        .values(is_favorite=to_favorite)
+        .returning(interactions.c.id,
+                   interactions.c.is_favorite,
+                   select(QuestionModel.category_id)
+                   .join(Answer)
+                   .where(Answer.interaction_id == interaction_id)
+                   .limit(1)
+                   .scalar_subquery())
+    )).first()
 
-    interaction.is_favorite = to_favorite
-    session.add(interaction)
-    session.add(interaction)
-    await session.flush()
+    if interaction is None:
+        raise HTTPException(status_code=404, detail='History entity with this id doesnt exist')
 
-    categoryId = (await session.execute(select(QuestionModel).join(Answer)
-                                        .where(Answer.interaction_id == interaction_id))).scalars().first().category_id
+    if compact:
+        return FavoriteResponse(message='status success',
+                                data=FavoriteInteraction(id=interaction[0], isFavorite=interaction[1]))
 
-    return await get_history(session=session, user_id=user_id, category_id=categoryId)
+    return await get_history(session=session, user_id=user_id, category_id=interaction[2])
 
 @router.get('/gptHistory', responses={200: {'model': HistoryResponse},
                                            300: {'model': BaseResponse, 'description': 'user is blocked'},
@@ -105,30 +135,72 @@ async def get_history_route(categoryId: uuid.UUID,
                             user_token: AccessTokenPayload=Depends(get_access_token),
                             session: AsyncSession=Depends(get_async_session)) -> HistoryResponse:
     return await get_history(session=session, user_id=user_token.id, category_id=categoryId)
-@router.post('/gptHistoryFavorite', responses={200: {'model': HistoryResponse},
+
+@router.get('/gptHistoryPage', responses={200: {'model': HistoryPageResponse},
+                                          300: {'model': BaseResponse, 'description': 'user is blocked'},
+                                          400: {'model': BaseResponse, 'description': 'invalid cursor'},
+                                          401: {'model': BaseResponse, 'description': 'user is not authorized'},
+                                          498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
+async def get_history_page_route(categoryId: uuid.UUID,
+                                 cursor: str=None,
+                                 limit: int=Query(default=20, ge=1, le=100),
+                                 summary: bool=True,
+                                 favorites: bool=False,
+                                 user_token: AccessTokenPayload=Depends(get_access_token),
+                                 session: AsyncSession=Depends(get_async_session)) -> HistoryPageResponse:
+    return await get_history_page(session=session,
+                                  user_id=user_token.id,
+                                  category_id=categoryId,
+                                  cursor=cursor,
+                                  limit=limit,
+                                  summary=summary,
+                                  favorites=favorites)
+
+@router.get('/gptHistory/{interactionId}', responses={200: {'model': GptInteractionResponse},
+                                                      300: {'model': BaseResponse, 'description': 'user is blocked'},
+                                                      400: {'model': BaseResponse, 'description': 'error: User-Agent required'},
+                                                      401: {'model': BaseResponse, 'description': 'user is not authorized'},
+                                                      404: {'model': BaseResponse, 'description': 'History entity with this id doesnt exist'},
+                                                      498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
+async def get_history_entity(interactionId: uuid.UUID,
+                             user_token: AccessTokenPayload=Depends(get_access_token),
+                             session: AsyncSession=Depends(get_async_session)) -> GptInteractionResponse:
+    interactions = (await get_history(session=session,
+                                      user_id=user_token.id,
+                                      interaction_ids=[interactionId])).data
+    if not interactions:
+        raise HTTPException(status_code=404, detail='History entity with this id doesnt exist')
+
+    return GptInteractionResponse(message='status success', data=interactions[0])
+
+@router.post('/gptHistoryFavorite', responses={200: {'model': HistoryResponse | FavoriteResponse},
                                                     300: {'model': BaseResponse, 'description': 'user is blocked'},
                                                     400: {'model': BaseResponse, 'description': 'error: User-Agent required'},
                                                     401: {'model': BaseResponse, 'description': 'user is not authorized'},
                                                     404: {'model': BaseResponse, 'description': 'History entity with this id doesnt exist'},
                                                     498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
 async def add_to_favorite(id_schema: IdSchema,
+                          compact: bool=False,
                           user_token: AccessTokenPayload=Depends(get_access_token),
-                          session: AsyncSession=Depends(get_async_session)) -> HistoryResponse:
+                          session: AsyncSession=Depends(get_async_session)) -> HistoryResponse | FavoriteResponse:
     return await switch_favorite(session=session,
                                  user_id=user_token.id,
                                  interaction_id=id_schema.id,
-                                 to_favorite=True)
+                                 to_favorite=True,
+                                 compact=compact)
 
-@router.delete('/gptHistoryFavorite', responses={200: {'model': HistoryResponse},
+@router.delete('/gptHistoryFavorite', responses={200: {'model': HistoryResponse | FavoriteResponse},
                                                       300: {'model': BaseResponse, 'description': 'user is blocked'},
                                                       400: {'model': BaseResponse, 'description': 'error: User-Agent required'},
                                                       401: {'model': BaseResponse, 'description': 'user is not authorized'},
                                                       404: {'model': BaseResponse, 'description': 'History entity with this id doesnt exist'},
                                                       498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
 async def delete_from_favorite(id: uuid.UUID,
+                               compact: bool=False,
                                user_token: AccessTokenPayload=Depends(get_access_token),
-                               session: AsyncSession=Depends(get_async_session)) -> HistoryResponse:
+                               session: AsyncSession=Depends(get_async_session)) -> HistoryResponse | FavoriteResponse:
     return await switch_favorite(session=session,
                                  user_id=user_token.id,
                                  interaction_id=id,
-                                 to_favorite=False)
+                                 to_favorite=False,
+                                 compact=compact)
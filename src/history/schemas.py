@@ -21,3 +21,24 @@ class UsersHistoryResponse(BaseResponse):
 
 class HistoryResponse(BaseResponse):
     data: list[GptInteraction]
+
+class GptInteractionSummary(BaseModel):
+    id: uuid.UUID
+    categoryId: uuid.UUID
+    dateTime: datetime.datetime
+    preview: str
+    isFavorite: bool
+
+class HistoryPageResponse(BaseResponse):
+    data: list[GptInteraction] | list[GptInteractionSummary]
+    nextCursor: str | None
+
+class GptInteractionResponse(BaseResponse):
+    data: GptInteraction
+
+class FavoriteInteraction(BaseModel):
+    id: uuid.UUID
+    isFavorite: bool
+
+class FavoriteResponse(BaseResponse):
+    data: FavoriteInteraction
@@ -0,0 +1,66 @@
+import ipaddress
+from bisect import bisect_right
+from typing import Iterable
+
+from fastapi import HTTPException, Request
+
+IpNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+class IpRanges:
+    def __init__(self, networks: Iterable[IpNetwork]):
+        self.ranges: dict[int, tuple[list[int], list[int]]] = {}
+        for version in (4, 6):
+            merged: list[list[int]] = []
+            for start, end in sorted((int(network.network_address), int(network.broadcast_address))
+                                     for network in networks if network.version == version):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.ranges[version] = ([start for start, _ in merged], [end for _, end in merged])
+
+    def __contains__(self, ip: ipaddress.IPv4Address | ipaddress.IPv6Address) -> bool:
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        starts, ends = self.ranges[ip.version]
+        value = int(ip)
+        position = bisect_right(starts, value) - 1
+        return position >= 0 and value <= ends[position]
+
+
+def parse_ip(ip: str) -> ipaddress.IPv4Address | ipaddress.IPv6Address | None:
+    try:
+        return ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return None
+
+
+class IpAllowlist:
+    def __init__(self,
+                 networks: Iterable[IpNetwork],
+                 trusted_proxies: Iterable[IpNetwork]=(),
+                 detail: str='access denied'):
+        self.networks = IpRanges(networks)
+        self.trusted_proxies = IpRanges(trusted_proxies)
+        self.detail = detail
+
+    def get_client_ip(self, request: Request) -> ipaddress.IPv4Address | ipaddress.IPv6Address | None:
+        ip = parse_ip(request.client.host) if request.client is not None else None
+        if ip is None or ip not in self.trusted_proxies:
+            return ip
+        for forwarded in reversed(request.headers.get('X-Forwarded-For', '').split(',')):
+            if (forwarded_ip := parse_ip(forwarded)) is None:
+                return None
+            ip = forwarded_ip
+            if ip not in self.trusted_proxies:
+                break
+        return ip
+
+    def is_allowed(self, request: Request) -> bool:
+        ip = self.get_client_ip(request)
+        return ip is not None and ip in self.networks
+
+    async def __call__(self, request: Request):
+        if not self.is_allowed(request):
+            raise HTTPException(status_code=403, detail=self.detail)
@@ -11,6 +11,11 @@ from admin.routers import router as admin_router
 from templates.routers import router as template_router
 from payment.routers import router as payment_router
 from config import ORIGINS
+from clients import http_clients
+from cache import invalidation_bus
+from auth.token_store import last_use_writer
+from database import async_session_maker
+from questions.catalog import catalog
 from error_handlers import http_exception_handler
 
 app = FastAPI()
@@ -23,6 +28,20 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
+@app.on_event('startup')
+async def startup():
+    await http_clients.start()
+    async with async_session_maker() as session:
+        await catalog.reload(session)
+    invalidation_bus.start()
+    last_use_writer.start()
+
+@app.on_event('shutdown')
+async def shutdown():
+    await invalidation_bus.stop()
+    await last_use_writer.stop()
+    await http_clients.close()
+
 app.add_exception_handler(HTTPException, http_exception_handler)
 app.include_router(auth_router)
 app.include_router(questions_router)
@@ -0,0 +1,123 @@
+import hashlib
+import uuid
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from admin.schemas import AdminProductsResponse, ProductsResponse
+from cache import invalidation_bus
+from config import PRODUCT_CATALOG_TTL_SECONDS
+from database import get_async_session
+from payment.models import ProductCategory
+from payment.models import Product as ProductModel
+from payment.models import PromoCode as PromoCodeModel
+from payment.schemas import AdminProduct as AdminProductSchema
+from payment.schemas import Product as ProductSchema
+from payment.schemas import PromoCode as PromoCodeSchema
+from questions.catalog import Catalog
+
+
+def get_etag(response: AdminProductsResponse | ProductsResponse) -> str:
+    return '"' + hashlib.sha256(response.json().encode()).hexdigest()[:32] + '"'
+
+def get_discounted_price(price: int, promo_code: PromoCodeSchema | None) -> int:
+    if promo_code is not None:
+        price = price - promo_code.discountAbsolute if promo_code.discountAbsolute is not None else price
+        price = int(price * (1 - promo_code.discountPercent / 100)) if promo_code.discountPercent is not None else price
+    return max(price, 1)
+
+
+class ProductCatalogSnapshot:
+    def __init__(self,
+                 version: int,
+                 products: list[AdminProductSchema],
+                 category_ids: dict[uuid.UUID, list[uuid.UUID]],
+                 active_ids: set[uuid.UUID]):
+        self.version = version
+        self.products_by_id = {product.id: product for product in products}
+        self.category_ids = category_ids
+        self.promo_codes = {promo_code.code: (product, promo_code)
+                            for product in products for promo_code in product.promoCodes}
+        self.prices = {(product.id, None): get_discounted_price(product.priceRubbles, None) for product in products}
+        self.prices.update({(product.id, code): get_discounted_price(product.priceRubbles, promo_code)
+                            for code, (product, promo_code) in self.promo_codes.items()})
+
+        active_products = [product for product in products if product.id in active_ids]
+        self.admin_response = AdminProductsResponse(message='status success', data=active_products)
+        self.public_response = ProductsResponse(
+            message='status success',
+            data=[ProductSchema(**product.dict(exclude={'returnUrl', 'promoCodes', 'isPromo'}))
+                  for product in active_products if product.title != 'free' and not product.isPromo])
+        self.admin_etag = get_etag(self.admin_response)
+        self.public_etag = get_etag(self.public_response)
+
+    def get_product(self, product_id: uuid.UUID) -> AdminProductSchema:
+        product = self.products_by_id.get(product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail='product not found')
+        return product
+
+    def get_price(self, product_id: uuid.UUID, promo_code: str | None) -> int:
+        self.get_product(product_id)
+        price = self.prices.get((product_id, promo_code))
+        if price is None:
+            raise HTTPException(status_code=404, detail='promo_code not found')
+        return price
+
+    def get_promo_product(self, promo_code: str) -> AdminProductSchema | None:
+        product, _ = self.promo_codes.get(promo_code, (None, None))
+        return product if product is not None and product.isPromo else None
+
+
+async def load_product_catalog_snapshot(session: AsyncSession, version: int) -> ProductCatalogSnapshot:
+    categories = (await session.execute(select(ProductCategory)
+                                        .order_by(ProductCategory.category_id))).scalars().all()
+    products = (await session.execute(select(ProductModel)
+                                      .order_by(ProductModel.price_rubbles))).scalars().all()
+    promos = (await session.execute(select(PromoCodeModel)
+                                    .order_by(PromoCodeModel.id))).scalars().all()
+
+    category_ids = {product.id: [] for product in products}
+    for category in categories:
+        category_ids[category.product_id].append(category.category_id)
+
+    promo_codes = {product.id: [] for product in products}
+    for promo in promos:
+        promo_codes[promo.product_id].append(PromoCodeSchema(id=promo.id,
+                                                             code=promo.code,
+                                                             discountAbsolute=promo.discount_absolute,
+                                                             discountPercent=promo.discount_percent))
+
+    return ProductCatalogSnapshot(
+        version=version,
+        products=[AdminProductSchema(id=product.id,
+                                     title=product.title,
+                                     priceRubbles=product.price_rubbles,
+                                     availabilityDurationDays=product.availability_duration_days,
+                                     usageCount=product.usage_count,
+                                     description=product.description,
+                                     returnUrl=product.return_url,
+                                     promoCodes=promo_codes[product.id],
+                                     isPromo=product.is_promo,
+                                     categoryIds=category_ids[product.id] if product.categories_size is None else None,
+                                     expandable=product.expandable,
+                                     categoriesSize=product.categories_size,
+                                     expanding=product.expanding)
+                  for product in products],
+        category_ids=category_ids,
+        active_ids={product.id for product in products if product.active}
+    )
+
+
+product_catalog = Catalog(load_product_catalog_snapshot, ttl=PRODUCT_CATALOG_TTL_SECONDS)
+invalidation_bus.subscribe('products', product_catalog.invalidate)
+
+async def get_product_catalog(session: AsyncSession=Depends(get_async_session)) -> ProductCatalogSnapshot:
+    return await product_catalog.get(session)
+
+async def refresh_product_catalog(session: AsyncSession) -> ProductCatalogSnapshot:
+    await session.commit()
+    await product_catalog.reload(session)
+    await invalidation_bus.publish('products')
+    return await product_catalog.get(session)
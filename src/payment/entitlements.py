@@ -0,0 +1,90 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import LRUCache
+from config import ENTITLEMENT_CACHE_SIZE, ENTITLEMENT_CACHE_TTL_SECONDS
+from payment.models import Product, ProductCategory, Purchase, PurchaseCategory
+from payment.schemas import UserAccess
+from users.models import User
+
+
+class PurchaseEntitlement:
+    def __init__(self,
+                 id: uuid.UUID,
+                 product_title: str | None,
+                 expiration_time: datetime | None,
+                 remaining_uses: int | None,
+                 purchase_category_ids: list[uuid.UUID] | None,
+                 product_category_ids: list[uuid.UUID] | None):
+        self.id = id
+        self.product_title = product_title
+        self.expiration_time = expiration_time
+        self.remaining_uses = remaining_uses
+        self.purchase_category_ids = frozenset(purchase_category_ids or [])
+        self.product_category_ids = frozenset(product_category_ids or [])
+
+    def is_active(self, now: datetime) -> bool:
+        return ((self.expiration_time is None or self.expiration_time > now)
+                and (self.remaining_uses is None or self.remaining_uses > 0))
+
+
+class EntitlementSnapshot:
+    def __init__(self, purchases: list[PurchaseEntitlement]):
+        self.purchases = purchases
+        self.category_ids = frozenset().union(*[purchase.purchase_category_ids | purchase.product_category_ids
+                                                for purchase in purchases])
+        self.paid_purchase = next((purchase for purchase in purchases if purchase.product_title not in (None, 'free')), None)
+
+    def access(self) -> UserAccess:
+        return UserAccess(remainingUses=self.paid_purchase.remaining_uses if self.paid_purchase else None,
+                          categoryIds=list(self.category_ids),
+                          expirationTime=self.paid_purchase.expiration_time if self.paid_purchase else None)
+
+    def find_purchase(self, parent_id: uuid.UUID | None) -> PurchaseEntitlement | None:
+        if parent_id is None:
+            return None
+        now = datetime.now()
+        active = [purchase for purchase in self.purchases if purchase.is_active(now)]
+        return next((purchase for purchase in active if parent_id in purchase.purchase_category_ids),
+                    next((purchase for purchase in active if parent_id in purchase.product_category_ids), None))
+
+
+async def load_entitlements(session: AsyncSession, user_id: uuid.UUID) -> EntitlementSnapshot:
+    purchases = (await session.execute(
+        select(Purchase.id,
+               Product.title,
+               Purchase.expiration_time,
+               Purchase.remaining_uses,
+               select(func.array_agg(PurchaseCategory.category_id))
+               .where(PurchaseCategory.purchase_id == Purchase.id)
+               .scalar_subquery(),
+               select(func.array_agg(ProductCategory.category_id))
+               .where(ProductCategory.product_id == Purchase.product_id)
+               .scalar_subquery())
+        .join(Product, isouter=True)
+        .where(Purchase.user_id == user_id)
+    )).all()
+    return EntitlementSnapshot([PurchaseEntitlement(*purchase) for purchase in purchases])
+
+
+entitlement_cache = LRUCache(maxsize=ENTITLEMENT_CACHE_SIZE, ttl=ENTITLEMENT_CACHE_TTL_SECONDS)
+
+async def get_entitlements(session: AsyncSession, user_id: uuid.UUID) -> EntitlementSnapshot:
+    version = (await session.execute(select(User.entitlement_version).where(User.id == user_id))).scalar()
+    if (cached := entitlement_cache.get(user_id)) is not None and cached[0] == version:
+        return cached[1]
+    snapshot = await load_entitlements(session, user_id)
+    entitlement_cache.set(user_id, (version, snapshot))
+    return snapshot
+
+async def touch_entitlements(session: AsyncSession, user_id: uuid.UUID):
+    await session.execute(update(User)
+                          .where(User.id == user_id)
+                          .values(entitlement_version=User.entitlement_version + 1))
+
+async def refresh_entitlements(session: AsyncSession, user_id: uuid.UUID):
+    await touch_entitlements(session, user_id)
+    await session.commit()
@@ -0,0 +1,120 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, delete, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from payment.entitlements import touch_entitlements
+from payment.models import Purchase, PaymentCategory, PurchaseCategory, PaymentEvent
+from payment.models import Product as ProductModel
+from payment.models import Payment as PaymentModel
+
+
+def get_event_key(notification: dict) -> str:
+    return f"{notification['event']}:{notification['object']['id']}"
+
+async def record_payment_event(session: AsyncSession, notification: dict) -> bool:
+    return (await session.execute(
+        insert(PaymentEvent)
+        .values(id=uuid.uuid4(),
+                event_key=get_event_key(notification),
+                event=notification['event'],
+                payload=json.dumps(notification),
+                received_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[PaymentEvent.event_key])
+        .returning(PaymentEvent.id)
+    )).scalar() is not None
+
+async def apply_payment_succeeded(session: AsyncSession, notification: dict) -> uuid.UUID | None:
+    payment_id = uuid.UUID(hex=notification['object']['id'])
+    payment = await session.get(PaymentModel, payment_id)
+    if payment is None:
+        return None
+    product = await session.get(ProductModel, payment.product_id)
+
+    if product.expanding:
+        purchase = (await session.execute(
+            select(Purchase)
+            .where(and_(Purchase.user_id == payment.user_id,
+                        Purchase.product_id == payment.product_to_expend_id))
+        )).scalars().first()
+        purchase.remaining_uses += product.usage_count
+        await session.delete(payment)
+        return payment.user_id
+
+    free_product = (
+        await session.execute(select(ProductModel).where(ProductModel.title == 'free'))).scalars().first()
+    await session.execute(
+        delete(Purchase)
+        .where(Purchase.user_id == payment.user_id)
+    )
+    session.add(Purchase(
+        id=uuid.uuid4(),
+        user_id=payment.user_id,
+        product_id=free_product.id,
+        expiration_time=datetime.now() + timedelta(days=product.availability_duration_days)
+        if product.availability_duration_days is not None else None,
+        remaining_uses=None
+    ))
+
+    categories = (await session.execute(
+        select(PaymentCategory.category_id).where(PaymentCategory.payment_id == payment_id)
+    )).scalars().all()
+
+    purchase_id = uuid.uuid4()
+
+    session.add(Purchase(
+        id=purchase_id,
+        user_id=payment.user_id,
+        product_id=payment.product_id,
+        expiration_time=datetime.now() + timedelta(days=product.availability_duration_days)
+        if product.availability_duration_days is not None else None,
+        remaining_uses=product.usage_count
+    ))
+    await session.flush()
+
+    session.add_all([PurchaseCategory(purchase_id=purchase_id,
+                                      category_id=category_id)
+                     for category_id in categories])
+
+    await session.delete(payment)
+    return payment.user_id
+
+EVENT_HANDLERS: dict[str, Callable[[AsyncSession, dict], Awaitable[uuid.UUID | None]]] = {
+    'payment.succeeded': apply_payment_succeeded
+}
+
+async def process_next_payment_event(session_maker: sessionmaker) -> bool:
+    async with session_maker() as session:
+        event = (await session.execute(
+            select(PaymentEvent)
+            .where(PaymentEvent.processed_at.is_(None))
+            .order_by(PaymentEvent.received_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).scalars().first()
+        if event is None:
+            return False
+
+        handler = EVENT_HANDLERS.get(event.event)
+        try:
+            async with session.begin_nested():
+                user_id = await handler(session, json.loads(event.payload)) if handler is not None else None
+                if user_id is not None:
+                    await touch_entitlements(session, user_id)
+        except Exception as error:
+            event.error = repr(error)
+        event.processed_at = datetime.utcnow()
+        await session.commit()
+
+    return True
+
+async def process_payment_events(session_maker: sessionmaker, limit: int=100) -> int:
+    processed = 0
+    while processed < limit and await process_next_payment_event(session_maker):
+        processed += 1
+    return processed
@@ -1,7 +1,7 @@
 import datetime
 import uuid
 
-from sqlalchemy import Column, UUID, Integer, String, ForeignKey, TIMESTAMP, BOOLEAN
+from sqlalchemy import Column, UUID, Integer, String, ForeignKey, TIMESTAMP, BOOLEAN, Index
 
 from questions.models import Base
 
@@ -62,6 +62,10 @@ class Purchase(Base, UserProductMixin):
     expiration_time = Column(TIMESTAMP)
     remaining_uses = Column(Integer)
 
+    __table_args__ = (
+        Index('ix_purchase_user_product', 'user_id', 'product_id'),
+    )
+
     def __init__(self,
                  id: uuid.UUID,
                  user_id: uuid.UUID,
@@ -99,6 +103,10 @@ class PromoCode(Base):
     discount_percent = Column(Integer)
     product_id = Column(ForeignKey('product.id', ondelete='cascade'), nullable=False)
 
+    __table_args__ = (
+        Index('ix_promo_code_product_code', 'product_id', 'code'),
+    )
+
     def __init__(self,
                  id: uuid.UUID,
                  code: str,
@@ -143,3 +151,33 @@ class PaymentCategory(Base):
                  category_id: uuid.UUID):
         self.payment_id = payment_id
         self.category_id = category_id
+
+class PaymentEvent(Base):
+    __tablename__ = 'payment_event'
+    id = Column(UUID, primary_key=True)
+    event_key = Column(String, nullable=False, unique=True)
+    event = Column(String, nullable=False)
+    payload = Column(String, nullable=False)
+    received_at = Column(TIMESTAMP, nullable=False)
+    processed_at = Column(TIMESTAMP)
+    error = Column(String)
+
+    __table_args__ = (
+        Index('ix_payment_event_pending', 'received_at', postgresql_where=processed_at.is_(None)),
+    )
+
+    def __init__(self,
+                 id: uuid.UUID,
+                 event_key: str,
+                 event: str,
+                 payload: str,
+                 received_at: datetime.datetime,
+                 processed_at: datetime.datetime | None=None,
+                 error: str | None=None):
+        self.id = id
+        self.event_key = event_key
+        self.event = event
+        self.payload = payload
+        self.received_at = received_at
+        self.processed_at = processed_at
+        self.error = error
@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import update, and_, true
+from sqlalchemy.orm import sessionmaker
+
+from database import async_session_maker
+from payment.events import process_payment_events
+from payment.models import PaymentEvent
+
+
+async def replay_payment_events(session_maker: sessionmaker,
+                                event_keys: list[str] | None=None,
+                                failed: bool=False,
+                                since: datetime | None=None) -> int:
+    async with session_maker.begin() as session:
+        await session.execute(
+            update(PaymentEvent)
+            .where(and_(PaymentEvent.event_key.in_(event_keys) if event_keys else true(),
+                        PaymentEvent.error.is_not(None) if failed else true(),
+                        PaymentEvent.received_at >= since if since is not None else true()))
+            .values(processed_at=None, error=None)
+        )
+    return await process_payment_events(session_maker, limit=2 ** 31)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reapply recorded YooKassa webhook events')
+    parser.add_argument('event_keys', nargs='*', help='event keys like payment.succeeded:<payment id>')
+    parser.add_argument('--failed', action='store_true', help='only events that failed to apply')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='only events received after this UTC time')
+    args = parser.parse_args()
+    if not (args.event_keys or args.failed or args.since):
+        parser.error('pass event keys, --failed or --since')
+    print(asyncio.run(replay_payment_events(async_session_maker, args.event_keys, args.failed, args.since)))
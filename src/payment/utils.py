@@ -1,67 +1,80 @@
 import uuid
-from datetime import datetime
+from typing import AsyncIterator, Iterator
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, and_, update, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.routes import get_access_token
 from auth.utils import AccessTokenPayload
+from config import PAYWALL_ON, PAYWALL_RESERVE_SYMBOLS
 from database import get_async_session
-from payment.models import ProductCategory, Purchase, PurchaseCategory, Product
-from questions.models import Category
+from payment.entitlements import get_entitlements, refresh_entitlements
+from payment.models import Purchase
+from questions.catalog import CatalogSnapshot, get_catalog
 from questions.schemas import CategoryId
 
 
 class Paywall:
-    symbols_in_response: int
-    category_id: uuid.UUID
+    def __init__(self, category_id: uuid.UUID, purchase_id: uuid.UUID | None=None, reserved: int=0):
+        self.category_id = category_id
+        self.purchase_id = purchase_id
+        self.reserved = reserved
+        self.symbols_in_response = 0
 
-class PaywallManager(Paywall):
-    async def __call__(self,
-                       category_id: CategoryId,
-                       session: AsyncSession=Depends(get_async_session),
-                       user_token: AccessTokenPayload=Depends(get_access_token)) -> uuid.UUID:
+async def reserve_purchase(session: AsyncSession, purchase_id: uuid.UUID, symbols: int) -> int | None:
+    purchase = Purchase.__table__
+    locked = (select(purchase.c.id, func.least(purchase.c.remaining_uses, symbols).label('reserved'))
+              .where(and_(purchase.c.id == purchase_id,
+                          purchase.c.remaining_uses > 0))
+              .with_for_update()
+              .subquery())
+    return (await session.execute(
+        update(purchase)
+        .where(purchase.c.id == locked.c.id)
+        .values(remaining_uses=purchase.c.remaining_uses - locked.c.reserved)
+        .returning(locked.c.reserved)
+    )).scalar()
 
-        self.category_id = category_id.categoryId
+async def settle_purchase(session: AsyncSession, purchase_id: uuid.UUID, reserved: int, symbols: int):
+    if symbols == reserved:
+        return
+    await session.execute(
+        update(Purchase)
+        .where(and_(Purchase.id == purchase_id,
+                    Purchase.remaining_uses.is_not(None)))
+        .values(remaining_uses=func.greatest(0, Purchase.remaining_uses - (symbols - reserved)))
+    )
 
-        purchase = (await session.execute(
-            select(Purchase)
-            .join(PurchaseCategory)
-            .join(Category, Category.parent_id==PurchaseCategory.category_id)
-            .where(and_(Purchase.user_id == user_token.id,
-                        or_(Purchase.expiration_time.is_(None),
-                            Purchase.expiration_time > datetime.now()),
-                        or_(Purchase.remaining_uses.is_(None),
-                            Purchase.remaining_uses > 0),
-                        Category.id == category_id.categoryId))
-        )).scalars().first()
+async def get_paywall(category_id: CategoryId,
+                      session: AsyncSession=Depends(get_async_session),
+                      catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
+                      user_token: AccessTokenPayload=Depends(get_access_token)) -> AsyncIterator[Paywall]:
+    category = catalog_snapshot.categories_by_id.get(category_id.categoryId)
+    purchase = (await get_entitlements(session, user_token.id)).find_purchase(
+        category.parentId if category is not None else None)
 
-        if purchase is None:
-            purchase = (await session.execute(
-                select(Purchase)
-                .join(Product)
-                .join(ProductCategory)
-                .join(Category, Category.parent_id==ProductCategory.category_id)
-                .where(and_(
-                    Purchase.user_id == user_token.id,
-                    or_(Purchase.expiration_time.is_(None),
-                        Purchase.expiration_time > datetime.now()),
-                    or_(Purchase.remaining_uses.is_(None),
-                        Purchase.remaining_uses > 0),
-                    Category.id == category_id.categoryId
-                    ))
-            )).scalars().first()
+    if purchase is None:
+        raise HTTPException(status_code=403, detail='Access denied')
 
-        if purchase is None:
-            raise HTTPException(status_code=403, detail='Access denied')
+    paywall = Paywall(category_id=category_id.categoryId, purchase_id=purchase.id)
 
-        yield self
+    if purchase.remaining_uses is None:
+        yield paywall
+        return
 
-        if purchase.remaining_uses is not None:
-            purchase.remaining_uses = max(0, purchase.remaining_uses - self.symbols_in_response)
+    paywall.reserved = await reserve_purchase(session, purchase.id, PAYWALL_RESERVE_SYMBOLS)
+    if paywall.reserved is None:
+        raise HTTPException(status_code=403, detail='Access denied')
+    await session.commit()
 
-class PaywallManagerTest(Paywall):
-    def __call__(self, category_id: CategoryId):
-        self.category_id = category_id.categoryId
-        yield self
\ No newline at end of file
+    try:
+        yield paywall
+    finally:
+        await settle_purchase(session, purchase.id, paywall.reserved, paywall.symbols_in_response)
+        await refresh_entitlements(session, user_token.id)
+
+def get_test_paywall(category_id: CategoryId) -> Iterator[Paywall]:
+    yield Paywall(category_id=category_id.categoryId)
+
+paywall = get_paywall if PAYWALL_ON else get_test_paywall
@@ -0,0 +1,69 @@
+import uuid
+from typing import Iterable
+
+from sqlalchemy import select, and_, func, Column, Row, Select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from questions.catalog import CatalogSnapshot
+from questions.models import Answer as AnswerModel
+from questions.models import Question as QuestionModel
+from questions.schemas import AdminQuestion, Question as QuestionSchema
+from utils import try_uuid
+
+OPTION_QUESTION_TYPES = ('options', 'semi-options')
+
+AnswerSets = dict[uuid.UUID, list[QuestionSchema]]
+
+def aggregate_answers():
+    return (func.array_agg(aggregate_order_by(AnswerModel.text.distinct(), AnswerModel.text))
+            .filter(AnswerModel.text.is_not(None)))
+
+def get_answer_sets_query(parent_key: Column, user_id: uuid.UUID, parent_ids: list[uuid.UUID]) -> Select:
+    return (select(parent_key,
+                   AnswerModel.question_id,
+                   aggregate_answers())
+            .join(QuestionModel)
+            .where(and_(AnswerModel.user_id == user_id,
+                        parent_key.in_(parent_ids)))
+            .group_by(parent_key, AnswerModel.question_id, QuestionModel.order_index)
+            .order_by(parent_key, QuestionModel.order_index))
+
+def decode_answers(question: AdminQuestion, answers: list[str] | None) -> list[str] | list[uuid.UUID | str]:
+    if not answers:
+        return []
+    if question.questionType in OPTION_QUESTION_TYPES:
+        return [try_uuid(answer) for answer in answers]
+    return answers
+
+def get_question_schema(snapshot: CatalogSnapshot,
+                        question_id: uuid.UUID,
+                        answers: list[str] | None) -> QuestionSchema | None:
+    if (question := snapshot.questions_by_id.get(question_id)) is None:
+        return None
+    answers = decode_answers(question, answers)
+    return QuestionSchema.construct(id=question.id,
+                                    question=question.question,
+                                    snippet=question.snippet,
+                                    options=snapshot.public_options.get(question.id),
+                                    isRequired=question.isRequired,
+                                    categoryId=question.categoryId,
+                                    questionType=question.questionType,
+                                    answer=answers[0] if len(answers) == 1 else None,
+                                    answers=answers if len(answers) > 1 else None)
+
+def map_answer_sets(rows: Iterable[Row], snapshot: CatalogSnapshot) -> AnswerSets:
+    answer_sets = {}
+    for parent_id, question_id, answers in rows:
+        if (question := get_question_schema(snapshot, question_id, answers)) is not None:
+            answer_sets.setdefault(parent_id, []).append(question)
+    return answer_sets
+
+async def get_answer_sets(session: AsyncSession,
+                          snapshot: CatalogSnapshot,
+                          parent_key: Column,
+                          user_id: uuid.UUID,
+                          parent_ids: list[uuid.UUID]) -> AnswerSets:
+    if not parent_ids:
+        return {}
+    return map_answer_sets(await session.execute(get_answer_sets_query(parent_key, user_id, parent_ids)), snapshot)
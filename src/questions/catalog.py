@@ -0,0 +1,131 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from fastapi import Depends
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import invalidation_bus
+from config import CATALOG_TTL_SECONDS
+from database import get_async_session
+from questions.models import Category as CategoryModel, Option, Prompt
+from questions.models import Question as QuestionModel
+from questions.prompts import CompiledPrompt
+from questions.schemas import AdminCategory, AdminQuestion, FullOption
+from questions.schemas import Option as OptionSchema
+from questions.schemas import Category as CategorySchema
+
+
+class CatalogSnapshot:
+    def __init__(self, version: int, categories: list[AdminCategory], questions: list[AdminQuestion]):
+        self.version = version
+        self.categories = categories
+        self.public_categories = [CategorySchema(**category.dict(exclude={'prompt'})) for category in categories]
+        self.categories_by_id = {category.id: category for category in categories}
+        self.questions_by_id = {question.id: question for question in questions}
+        self.questions_by_category: dict[uuid.UUID, list[AdminQuestion]] = {}
+        for question in questions:
+            self.questions_by_category.setdefault(question.categoryId, []).append(question)
+        self.options_by_id = {option.id: option for question in questions for option in question.options or []}
+        self.public_options = {question.id: [OptionSchema(id=option.id, text=option.text) for option in question.options]
+                               for question in questions if question.options is not None}
+        self.compiled_prompts = {category.id: CompiledPrompt(category.prompt) for category in categories}
+
+    def get_compiled_prompt(self, category_id: uuid.UUID) -> CompiledPrompt:
+        compiled_prompt = self.compiled_prompts.get(category_id)
+        return compiled_prompt if compiled_prompt is not None else CompiledPrompt([])
+
+
+async def load_catalog_snapshot(session: AsyncSession, version: int) -> CatalogSnapshot:
+    categories = (await session.execute(
+        select(CategoryModel, func.array_agg(aggregate_order_by(Prompt.text, Prompt.order_index)))
+        .join(Prompt, isouter=True)
+        .group_by(CategoryModel.id)
+        .order_by(CategoryModel.order_index)
+    )).all()
+
+    questions = (await session.execute(
+        select(QuestionModel,
+               func.array_agg(aggregate_order_by(Option.id, Option.option_text)),
+               func.array_agg(aggregate_order_by(Option.option_text, Option.option_text)),
+               func.array_agg(aggregate_order_by(Option.text_to_prompt, Option.option_text)))
+        .join(Option, isouter=True)
+        .group_by(QuestionModel.id)
+        .order_by(QuestionModel.order_index)
+    )).all()
+
+    return CatalogSnapshot(
+        version=version,
+        categories=[AdminCategory(id=category[0].id,
+                                  title=category[0].title,
+                                  description=category[0].description,
+                                  parentId=category[0].parent_id,
+                                  isMainScreenPresented=category[0].is_main_screen_presented,
+                                  isCategoryScreenPresented=category[0].is_category_screen_presented,
+                                  orderIndex=category[0].order_index,
+                                  prompt=category[1] if category[1] != [None] else [])
+                    for category in categories],
+        questions=[AdminQuestion(id=question[0].id,
+                                 question=question[0].question_text,
+                                 snippet=question[0].snippet,
+                                 isRequired=question[0].is_required,
+                                 categoryId=question[0].category_id,
+                                 questionType=question[0].type_,
+                                 orderIndex=question[0].order_index,
+                                 options=[FullOption(id=id,
+                                                     text=text,
+                                                     text_to_prompt=prompt_text)
+                                          for id, text, prompt_text in zip(question[1], question[2], question[3])]
+                                 if question[1] != [None] else None)
+                   for question in questions]
+    )
+
+
+class Catalog:
+    def __init__(self,
+                 load_snapshot: Callable[[AsyncSession, int], Awaitable[Any]]=load_catalog_snapshot,
+                 ttl: float | None=CATALOG_TTL_SECONDS):
+        self.load_snapshot = load_snapshot
+        self.ttl = ttl
+        self.snapshot: CatalogSnapshot | None = None
+        self.expires_at = 0.0
+        self.version = 0
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self.snapshot is not None and (self.ttl is None or time.monotonic() < self.expires_at)
+
+    async def get(self, session: AsyncSession) -> CatalogSnapshot:
+        if self.is_fresh():
+            return self.snapshot
+        async with self.lock:
+            while not self.is_fresh():
+                await self.reload(session)
+            return self.snapshot
+
+    async def reload(self, session: AsyncSession):
+        self.version += 1
+        version = self.version
+        snapshot = await self.load_snapshot(session, version)
+        if self.version == version:
+            self.snapshot = snapshot
+            self.expires_at = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+
+    def invalidate(self):
+        self.version += 1
+        self.snapshot = None
+
+
+catalog = Catalog()
+invalidation_bus.subscribe('catalog', catalog.invalidate)
+
+async def get_catalog(session: AsyncSession=Depends(get_async_session)) -> CatalogSnapshot:
+    return await catalog.get(session)
+
+async def refresh_catalog(session: AsyncSession):
+    await session.commit()
+    await catalog.reload(session)
+    await invalidation_bus.publish('catalog')
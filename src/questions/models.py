@@ -1,6 +1,7 @@
 import uuid
+from datetime import datetime
 
-from sqlalchemy import Column, UUID, String, BOOLEAN, ForeignKey, Integer
+from sqlalchemy import Column, UUID, String, BOOLEAN, ForeignKey, Integer, Index, TIMESTAMP, and_
 
 from templates.models import Base
 
@@ -25,7 +26,7 @@ class Category(Base):
     id=Column(UUID, primary_key=True)
     title=Column(String, nullable=False)
     description=Column(String)
-    parent_id=Column(UUID)
+    parent_id=Column(UUID, index=True)
     is_main_screen_presented = Column(BOOLEAN, nullable=False, default=False)
     is_category_screen_presented = Column(BOOLEAN, nullable=False, default=False)
     order_index = Column(String, nullable=False, unique=True)
@@ -43,6 +44,10 @@ class Prompt(Base):
     text = Column(String, nullable=False)
     order_index = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index('ix_prompt_category_order', 'category_id', 'order_index', postgresql_include=['text']),
+    )
+
 class Question(Base):
     __tablename__ = 'question'
     def __init__(self,
@@ -69,6 +74,10 @@ class Question(Base):
     order_index = Column(Integer, nullable=False)
     type_ = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index('ix_question_category_order', 'category_id', 'order_index'),
+    )
+
 class Answer(Base):
     __tablename__ = 'answer'
     def __init__(self,
@@ -91,6 +100,29 @@ class Answer(Base):
     text = Column(String)
     template_id = Column(ForeignKey('template.id', ondelete='cascade'))
 
+    __table_args__ = (
+        Index('ix_answer_draft', 'user_id', 'question_id',
+              postgresql_where=and_(interaction_id.is_(None), template_id.is_(None))),
+        Index('ix_answer_user_interaction', 'user_id', 'interaction_id'),
+        Index('ix_answer_user_template', 'user_id', 'template_id'),
+        Index('ix_answer_interaction', 'interaction_id'),
+    )
+
+class GptJob(Base):
+    __tablename__ = 'gpt_job'
+    def __init__(self, id: uuid.UUID, user_id: uuid.UUID, created_at: datetime):
+        self.id = id
+        self.user_id = user_id
+        self.created_at = created_at
+    id = Column(UUID, primary_key=True)
+    user_id = Column(ForeignKey('users.id', ondelete='cascade'), nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False, index=True)
+
+def draft_answers_of(user_id: uuid.UUID):
+    return and_(Answer.user_id == user_id,
+                Answer.interaction_id.is_(None),
+                Answer.template_id.is_(None))
+
 class Option(Base):
     __tablename__ = 'option'
     def __init__(self, id: uuid.UUID, question_id: uuid.UUID, option_text: str, text_to_prompt: str):
@@ -102,3 +134,7 @@ class Option(Base):
     question_id = Column(ForeignKey('question.id', ondelete='cascade'), nullable=False)
     option_text = Column(String, nullable=False)
     text_to_prompt = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index('ix_option_question', 'question_id', 'option_text'),
+    )
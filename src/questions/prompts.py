@@ -0,0 +1,48 @@
+from string import Formatter
+from typing import Any
+
+from fastapi import HTTPException
+
+formatter = Formatter()
+
+
+class CompiledPromptLine:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts: list[tuple[str, int | None]] | None = []
+        slots = []
+
+        try:
+            for literal, field_name, format_spec, conversion in formatter.parse(text):
+                if field_name is None:
+                    self.parts.append((literal, None))
+                    continue
+                if field_name.isdigit():
+                    slots.append(int(field_name))
+                    if not format_spec and conversion is None:
+                        self.parts.append((literal, int(field_name)))
+                        continue
+                self.parts = None
+                break
+        except ValueError:
+            self.parts = None
+
+        self.slots = tuple(slots)
+
+    def fill(self, answers: list[Any]) -> str:
+        if self.parts is None:
+            return self.text.format(*answers)
+        return ''.join(literal if slot is None else literal + str(answers[slot]) for literal, slot in self.parts)
+
+
+class CompiledPrompt:
+    def __init__(self, lines: list[str]):
+        self.lines = [CompiledPromptLine(line) for line in lines]
+        self.texts = lines
+
+    def fill(self, answers: list[Any]) -> str:
+        try:
+            return '\n'.join(line.fill(answers) for line in self.lines
+                             if not line.slots or any(answers[slot] is not None for slot in line.slots))
+        except (IndexError, KeyError, ValueError):
+            raise HTTPException(status_code=404, detail='Invalid prompt')
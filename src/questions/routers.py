@@ -1,133 +1,122 @@
-import re
+import json
 import uuid
 from datetime import datetime
-from typing import Callable
-from copy import deepcopy
+from typing import AsyncIterator, Callable, Iterable, Iterator
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, func, and_, update, delete
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, func, and_, delete, true, Select, Row
 from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
 import httpx
 
 from auth.routes import get_access_token
+from cache import MemoryCache, RedisCache
+from clients import get_openai_client
 from auth.utils import AccessTokenPayload
-from payment.utils import Paywall, PaywallManager, PaywallManagerTest
-from questions.models import Category as CategoryModel, Option, Prompt
+from payment.utils import Paywall, paywall
+from questions.models import Option, GptJob, draft_answers_of
 from questions.models import Answer as AnswerModel
 from questions.models import Question as QuestionModel
-from questions.schemas import Question as QuestionSchema, GptAnswerResponse, NewAnswers
-from questions.schemas import Category as CategorySchema
+from questions.schemas import Question as QuestionSchema, GptAnswerResponse, NewAnswers, GptJobResponse
 from questions.schemas import Answer as AnswerSchema
 from questions.schemas import Option as OptionSchema
-from questions.schemas import CategoriesResponse, QuestionsResponse
-from history.models import GptInteraction
+from questions.schemas import CategoriesResponse, QuestionsResponse, FullOption
+from questions.catalog import CatalogSnapshot, catalog, get_catalog
+from questions.prompts import CompiledPrompt
+from questions.utils import QuestionsData, save_interaction, get_answers_snapshot, cached_gpt_completion, \
+    cached_gpt_stream, get_gpt_cache
+from tasks.tasks import celery_app, generate_gpt_response
 from database import get_async_session
 from utils import BaseResponse, try_uuid
-from config import OPENAI_API_KEY, PAYWALL_ON
 
 router = APIRouter(prefix='/question',
                    tags=['Questions'])
 
-QuestionsData = list[tuple[QuestionModel, list[str], list[str], list[uuid.UUID]]]
+def parse_prompt_answer(question: QuestionSchema, options: dict[uuid.UUID, FullOption]) -> str | None:
+    answer = question.answer
+    if answer is None:
+        return None
+    if question.questionType == 'numeric' and not answer.isnumeric():
+        raise HTTPException(status_code=422, detail='answers to questions with numeric type must be numeric')
+    if question.questionType in ('options', 'semi-options'):
+        option_id = answer if isinstance(answer, uuid.UUID) else try_uuid(answer)
+        if isinstance(option_id, uuid.UUID):
+            if (option := options.get(option_id)) is None:
+                raise HTTPException(status_code=422, detail='option with this id doesnt exist')
+            return option.text_to_prompt
+        if question.questionType == 'options':
+            raise HTTPException(status_code=422, detail='optional questions must have uuid in answer')
+    return answer
 
 async def get_filled_prompt(questions: list[QuestionSchema],
-                            prompt: list[str],
+                            prompt: CompiledPrompt | list[str],
                             session: AsyncSession) -> str:
-    option_ids = []
+    options = (await catalog.get(session)).options_by_id
+    answers = [None] + [parse_prompt_answer(question, options) for question in questions]
 
-    for question in questions:
-        if question.answer is None:
-            continue
-        if question.questionType == 'options' or (question.questionType == 'semi-options'
-                                                  and isinstance(try_uuid(question.answer), uuid.UUID)):
-            try:
-                uuid.UUID(hex=question.answer)
-            except ValueError:
-                raise HTTPException(status_code=422, detail='optional questions must have uuid in answer')
-            option_ids.append(question.answer)
-        if question.questionType == 'numeric':
-            if not question.answer.isnumeric():
-                raise HTTPException(status_code=422, detail='answers to questions with numeric type must be numeric')
-
-    if option_ids != []:
-        options = (await session.execute(select(Option).where(Option.id.in_(option_ids)))).scalars().all()
-        options_dict = {}
-        for option in options:
-            options_dict[option.id] = option.text_to_prompt
-    answers = [None if question.answer is None
-               else options_dict[uuid.UUID(hex=question.answer)]
-               if question.questionType == 'options' or
-                  (question.questionType == 'semi-options'
-                   and isinstance(try_uuid(question.answer), uuid.UUID))
-               else question.answer
-               for question in questions]
-
-    answers.insert(0, None)
-
-    clean_prompt = deepcopy(prompt)
+    if not isinstance(prompt, CompiledPrompt):
+        prompt = CompiledPrompt(prompt)
 
-    try:
-        for prompt_el in prompt:
-            matches = [int(el) for el in re.findall(r'\{(\d+)\}', prompt_el)]
-            if len(matches) > 0 and all([answers[match] is None for match in matches]):
-                clean_prompt.remove(prompt_el)
-    except IndexError:
-        raise HTTPException(status_code=404, detail='Invalid prompt')
-
-    filled_prompt = '\n'.join(clean_prompt).format(*answers)
-
-    return filled_prompt
+    return prompt.fill(answers)
 
 async def filled_prompt_generator():
     return get_filled_prompt
 
-def get_gpt_send():
+def get_gpt_send(client: httpx.AsyncClient=Depends(get_openai_client),
+                 cache: MemoryCache | RedisCache | None=Depends(get_gpt_cache)):
     async def get_gpt_response(questions: list[QuestionSchema],
-                               prompt: list[str],
+                               prompt: CompiledPrompt | list[str],
                                session: AsyncSession) -> str:
 
         filled_prompt = await get_filled_prompt(questions, prompt, session)
 
-        max_time_wait = 300
+        return await cached_gpt_completion(client, filled_prompt, cache)
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(max_time_wait)) as client:
-            response = await client.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {OPENAI_API_KEY}'
-                },
-                json={
-                    'model': 'gpt-4',
-                    'messages': [{'role': 'user', 'content': filled_prompt}]
-                }
-            )
+    return get_gpt_response
 
-        return response.json()['choices'][0]['message']['content']
+def get_gpt_stream(client: httpx.AsyncClient=Depends(get_openai_client),
+                   cache: MemoryCache | RedisCache | None=Depends(get_gpt_cache)):
+    def get_gpt_response_stream(filled_prompt: str) -> AsyncIterator[str]:
+        return cached_gpt_stream(client, filled_prompt, cache)
 
-    return get_gpt_response
+    return get_gpt_response_stream
+
+def check_required_answers(questions: list[QuestionSchema]):
+    for question in questions:
+        if question.isRequired and ((not question.answers and not question.answer) or question.answer == ''):
+            raise HTTPException(status_code=400, detail='required fields not filled')
+
+def get_question_data_query(user_id: uuid.UUID, category_id: uuid.UUID | None=None) -> Select:
+    draft_answers = (select(func.array_agg(aggregate_order_by(AnswerModel.text, AnswerModel.id)).label('texts'),
+                            func.array_agg(aggregate_order_by(AnswerModel.id, AnswerModel.id)).label('ids'))
+                     .where(and_(AnswerModel.question_id == QuestionModel.id,
+                                 draft_answers_of(user_id)))
+                     .lateral('draft_answers'))
+    question_options = (select(func.array_agg(aggregate_order_by(Option.option_text, Option.option_text, Option.id)).label('texts'),
+                               func.array_agg(aggregate_order_by(Option.id, Option.option_text, Option.id)).label('ids'))
+                        .where(Option.question_id == QuestionModel.id)
+                        .lateral('question_options'))
+
+    return (select(QuestionModel,
+                   draft_answers.c.texts,
+                   question_options.c.texts,
+                   draft_answers.c.ids,
+                   question_options.c.ids)
+            .select_from(QuestionModel)
+            .join(draft_answers, true())
+            .join(question_options, true())
+            .where(and_(QuestionModel.category_id == category_id if category_id is not None else True,
+                        draft_answers.c.ids.is_not(None)))
+            .order_by(QuestionModel.order_index))
+
+def map_question_rows(rows: Iterable[Row]) -> Iterator[tuple[QuestionModel, list[str], list[str], list[uuid.UUID], list[uuid.UUID]]]:
+    for question, answer_texts, option_texts, answer_ids, option_ids in rows:
+        yield question, answer_texts, option_texts or [], answer_ids, option_ids or []
 
 async def get_question_data(user_id: uuid.UUID, session: AsyncSession, category_id: uuid.UUID | None=None) -> QuestionsData:
-    questions = (await session.execute(select(QuestionModel,
-                                              func.array_agg(AnswerModel.text),
-                                              func.array_agg(aggregate_order_by(Option.option_text, Option.option_text)),
-                                              func.array_agg(AnswerModel.id),
-                                              func.array_agg(aggregate_order_by(Option.id, Option.option_text)))
-                                       .join(AnswerModel)
-                                       .join(Option, isouter=True)
-                                       .where(and_(QuestionModel.category_id==category_id if category_id is not None else True,
-                                                   AnswerModel.interaction_id.is_(None),
-                                                   AnswerModel.template_id.is_(None),
-                                                   AnswerModel.user_id == user_id))
-                                       .group_by(QuestionModel.id)
-                                       .order_by(QuestionModel.order_index))).all()
-    questions = list(map(lambda q: (q[0],
-                                    list(zip(*list(set(list(zip(q[1], q[3]))))))[0] if q[0].type_ == 'options' else q[1],
-                                    list(filter(lambda opt: opt is not None, q[2])),
-                                    list(zip(*list(set(list(zip(q[1], q[3]))))))[1] if q[0].type_ == 'options' else q[3],
-                                    list(filter(lambda opt: opt is not None, q[4]))), questions))
-    return questions
+    return list(map_question_rows(await session.execute(get_question_data_query(user_id, category_id))))
 
 def get_question_schemas(questions: QuestionsData) -> list[QuestionSchema]:
     return list(map(lambda question_data:
@@ -149,19 +138,9 @@ def get_question_schemas(questions: QuestionsData) -> list[QuestionSchema]:
             dependencies=[Depends(get_access_token)],
             responses={200: {'model': CategoriesResponse},
                        400: {'model': BaseResponse}})
-async def get_categories(session: AsyncSession = Depends(get_async_session)) -> CategoriesResponse:
+async def get_categories(catalog_snapshot: CatalogSnapshot=Depends(get_catalog)) -> CategoriesResponse:
     return CategoriesResponse(message='status success',
-                              categories=list(map(lambda category_model:
-               CategorySchema(id=category_model.id,
-                              title=category_model.title,
-                              description=category_model.description,
-                              parentId=category_model.parent_id,
-                              isMainScreenPresented=category_model.is_main_screen_presented,
-                              isCategoryScreenPresented=category_model.is_category_screen_presented,
-                              orderIndex=category_model.order_index
-                              ),
-               (await session.execute(select(CategoryModel)
-                                      .order_by(CategoryModel.order_index))).scalars().all())))
+                              categories=catalog_snapshot.public_categories)
 
 @router.get('/questions', responses={200: {'model': QuestionsResponse},
                                           400: {'model': BaseResponse},
@@ -179,49 +158,154 @@ async def get_questions(categoryId: uuid.UUID | None=None,
              responses={200: {'model': GptAnswerResponse},
                         400: {'model': BaseResponse, 'description': 'required fields not filled'},
                         401: {'model': BaseResponse, 'description': 'User is not authorized'}})
-async def gpt_response(paywall_manager: Paywall=Depends(PaywallManager() if PAYWALL_ON else PaywallManagerTest()),
+async def gpt_response(paywall_manager: Paywall=Depends(paywall),
                        user_token: AccessTokenPayload=Depends(get_access_token),
                        session: AsyncSession=Depends(get_async_session),
+                       catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
                        gpt_send: Callable=Depends(get_gpt_send)) -> GptAnswerResponse:
     questions_data = await get_question_data(user_token.id, session, paywall_manager.category_id)
     questions = get_question_schemas(questions_data)
-    for question in questions:
-        if question.isRequired and ((not question.answers and not question.answer) or question.answer == ''):
-            raise HTTPException(status_code=400, detail='required fields not filled')
+    check_required_answers(questions)
 
-    prompt = (await session.execute(select(Prompt.text)
-                                    .where(Prompt.category_id == paywall_manager.category_id)
-                                    .order_by(Prompt.order_index))).scalars().all()
+    prompt = catalog_snapshot.get_compiled_prompt(paywall_manager.category_id)
 
     response = await gpt_send(questions, prompt, session)
 
     paywall_manager.symbols_in_response = len(response)
 
-    interaction_id = uuid.uuid4()
-    answer_ids = []
-    new_answers = []
-
-    session.add(GptInteraction(id=interaction_id,
-                               time_happened=(interaction_time:=datetime.now()),
-                               response=response))
-
-    for question_data in questions_data:
-        answer_ids.extend(question_data[3])
-        for ans_text in question_data[1]:
-            new_answers.append(AnswerModel(id=uuid.uuid4(),
-                                           question_id=question_data[0].id,
-                                           text=ans_text,
-                                           user_id=user_token.id))
-
-    await session.flush()
-    await session.execute(update(AnswerModel).where(AnswerModel.id.in_(answer_ids)).values(interaction_id=interaction_id))
-    session.add_all(new_answers)
+    interaction_id, interaction_time = await save_interaction(session, user_token.id, get_answers_snapshot(questions_data), response)
+
     return GptAnswerResponse(answerId=interaction_id,
                              dateTime=interaction_time,
                              message='status success',
                              questions=questions,
                              gptResponse=response)
 
+@router.post('/responseStream',
+             response_class=StreamingResponse,
+             responses={200: {'content': {'text/event-stream': {}},
+                              'description': 'GPT response chunks as server-sent events, '
+                                             'the last "done" event carries the saved GptAnswerResponse, '
+                                             'an "error" event ends a stream the GPT service broke off'},
+                        400: {'model': BaseResponse, 'description': 'required fields not filled'},
+                        401: {'model': BaseResponse, 'description': 'User is not authorized'},
+                        502: {'model': BaseResponse, 'description': 'GPT service is unavailable'}})
+async def gpt_response_stream(paywall_manager: Paywall=Depends(paywall),
+                              user_token: AccessTokenPayload=Depends(get_access_token),
+                              session: AsyncSession=Depends(get_async_session),
+                              catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
+                              get_filled_prompt: Callable=Depends(filled_prompt_generator),
+                              gpt_stream: Callable=Depends(get_gpt_stream)) -> StreamingResponse:
+    questions_data = await get_question_data(user_token.id, session, paywall_manager.category_id)
+    questions = get_question_schemas(questions_data)
+    check_required_answers(questions)
+
+    prompt = catalog_snapshot.get_compiled_prompt(paywall_manager.category_id)
+
+    filled_prompt = await get_filled_prompt(questions, prompt, session)
+
+    paywall_manager.symbols_in_response = 0
+
+    stream = aiter(gpt_stream(filled_prompt))
+    try:
+        first_chunk = await anext(stream, None)
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail='GPT service is unavailable')
+
+    async def events() -> AsyncIterator[str]:
+        chunks = []
+        chunk = first_chunk
+        try:
+            while chunk is not None:
+                chunks.append(chunk)
+                yield f'data: {json.dumps({"delta": chunk})}\n\n'
+                chunk = await anext(stream, None)
+        except (HTTPException, httpx.HTTPError):
+            yield 'event: error\ndata: ' + BaseResponse(message='GPT service is unavailable').json() + '\n\n'
+            return
+
+        response = ''.join(chunks)
+        paywall_manager.symbols_in_response = len(response)
+
+        interaction_id, interaction_time = await save_interaction(session, user_token.id, get_answers_snapshot(questions_data), response)
+
+        yield 'event: done\ndata: ' + GptAnswerResponse(answerId=interaction_id,
+                                                         dateTime=interaction_time,
+                                                         message='status success',
+                                                         questions=questions,
+                                                         gptResponse=response).json() + '\n\n'
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+@router.post('/responseJob',
+             responses={200: {'model': GptJobResponse},
+                        400: {'model': BaseResponse, 'description': 'required fields not filled'},
+                        401: {'model': BaseResponse, 'description': 'User is not authorized'}})
+async def gpt_response_job(paywall_manager: Paywall=Depends(paywall),
+                           user_token: AccessTokenPayload=Depends(get_access_token),
+                           session: AsyncSession=Depends(get_async_session),
+                           catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
+                           get_filled_prompt: Callable=Depends(filled_prompt_generator)) -> GptJobResponse:
+    questions_data = await get_question_data(user_token.id, session, paywall_manager.category_id)
+    questions = get_question_schemas(questions_data)
+    check_required_answers(questions)
+
+    prompt = catalog_snapshot.get_compiled_prompt(paywall_manager.category_id)
+
+    filled_prompt = await get_filled_prompt(questions, prompt, session)
+
+    paywall_manager.symbols_in_response = 0
+
+    job_id = uuid.uuid4()
+    session.add(GptJob(id=job_id, user_id=user_token.id, created_at=datetime.utcnow()))
+    await session.commit()
+    await run_in_threadpool(
+        generate_gpt_response.apply_async,
+        args=(str(user_token.id),
+              str(paywall_manager.purchase_id) if paywall_manager.purchase_id is not None else None,
+              paywall_manager.reserved,
+              filled_prompt,
+              [(str(question_id), texts, [str(answer_id) for answer_id in answer_ids])
+               for question_id, texts, answer_ids in get_answers_snapshot(questions_data)]),
+        task_id=str(job_id)
+    )
+    paywall_manager.symbols_in_response = paywall_manager.reserved
+
+    return GptJobResponse(message='status success',
+                          jobId=job_id,
+                          status='PENDING')
+
+@router.get('/response/{jobId}',
+            responses={200: {'model': GptJobResponse},
+                       401: {'model': BaseResponse, 'description': 'User is not authorized'},
+                       404: {'model': BaseResponse, 'description': 'Job with this id doesnt exist'},
+                       502: {'model': BaseResponse, 'description': 'GPT job failed'}})
+async def gpt_response_job_result(jobId: uuid.UUID,
+                                  user_token: AccessTokenPayload=Depends(get_access_token),
+                                  session: AsyncSession=Depends(get_async_session)) -> GptJobResponse:
+    job = await session.get(GptJob, jobId)
+    if job is None or job.user_id != user_token.id:
+        raise HTTPException(status_code=404, detail='Job with this id doesnt exist')
+
+    result = celery_app.AsyncResult(str(jobId))
+    status = await run_in_threadpool(lambda: result.state)
+
+    if status == 'FAILURE':
+        raise HTTPException(status_code=502, detail='GPT job failed')
+    if status != 'SUCCESS':
+        return GptJobResponse(message='status success',
+                              jobId=jobId,
+                              status=status)
+
+    job_result = await run_in_threadpool(lambda: result.result)
+
+    return GptJobResponse(message='status success',
+                          jobId=jobId,
+                          status=status,
+                          answerId=job_result['answerId'],
+                          dateTime=job_result['dateTime'],
+                          gptResponse=job_result['gptResponse'])
+
 @router.post('/questions', responses={200: {'model': QuestionsResponse},
                                            401: {'model': BaseResponse, 'description': 'User is not authorized'},
                                            404: {'model': BaseResponse, 'description': 'Question with this id doesnt exist'},
@@ -229,16 +313,17 @@ async def gpt_response(paywall_manager: Paywall=Depends(PaywallManager() if PAYW
                                            498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
 async def answer(answer: AnswerSchema,
                  user_token: AccessTokenPayload=Depends(get_access_token),
-                 session: AsyncSession=Depends(get_async_session)) -> QuestionsResponse:
+                 session: AsyncSession=Depends(get_async_session),
+                 catalog_snapshot: CatalogSnapshot=Depends(get_catalog)) -> QuestionsResponse:
 
-    if (question := await session.get(QuestionModel, answer.questionId)) is None:
+    if (question := catalog_snapshot.questions_by_id.get(answer.questionId)) is None:
         raise HTTPException(404, 'Question with this id doesnt exist')
 
     if answer.answers is None:
         if answer.answer is not None:
-            if question.type_ == 'numeric' and not answer.answer.isnumeric():
+            if question.questionType == 'numeric' and not answer.answer.isnumeric():
                 raise HTTPException(status_code=422, detail='answers to questions with numeric type must be numeric')
-            if question.type_ == 'options':
+            if question.questionType == 'options':
                 try:
                     uuid.UUID(hex=answer.answer)
                 except ValueError:
@@ -246,17 +331,13 @@ async def answer(answer: AnswerSchema,
         answer_model = (await session.execute(
                 select(AnswerModel)
                 .where(and_(AnswerModel.question_id == answer.questionId,
-                            AnswerModel.user_id == user_token.id,
-                            AnswerModel.template_id.is_(None),
-                            AnswerModel.interaction_id.is_(None)))
+                            draft_answers_of(user_token.id)))
         )).scalars().first()
         answer_model.text = answer.answer
     else:
         await session.execute(delete(AnswerModel).where(and_(
             AnswerModel.question_id == answer.questionId,
-            AnswerModel.user_id == user_token.id,
-            AnswerModel.template_id.is_(None),
-            AnswerModel.interaction_id.is_(None)
+            draft_answers_of(user_token.id)
         )))
         session.add_all(list(map(lambda a:
                                  AnswerModel(id=uuid.uuid4(),
@@ -269,7 +350,7 @@ async def answer(answer: AnswerSchema,
                              questions=get_question_schemas(
                                  await get_question_data(user_id=user_token.id,
                                                          session=session,
-                                                         category_id=question.category_id)))
+                                                         category_id=question.categoryId)))
 
 @router.post('/allQuestions')
 async def answer_all_questions(new_answers: NewAnswers,
@@ -282,12 +363,9 @@ async def answer_all_questions(new_answers: NewAnswers,
     answers = (await session.execute(
         select(AnswerModel)
         .join(QuestionModel)
-        .join(CategoryModel)
-        .where(and_(CategoryModel.id == new_answers.categoryId,
-                    AnswerModel.user_id == user_token.id,
+        .where(and_(QuestionModel.category_id == new_answers.categoryId,
                     AnswerModel.question_id.in_(question_ids),
-                    AnswerModel.interaction_id.is_(None),
-                    AnswerModel.template_id.is_(None))))
+                    draft_answers_of(user_token.id))))
                ).scalars().all()
 
     for answer in answers:
@@ -50,6 +50,13 @@ class GptAnswerResponse(QuestionsResponse):
     dateTime: datetime.datetime
     gptResponse: str
 
+class GptJobResponse(BaseResponse):
+    jobId: uuid.UUID
+    status: str
+    answerId: uuid.UUID | None
+    dateTime: datetime.datetime | None
+    gptResponse: str | None
+
 class PromptResponse(BaseResponse):
     questions: list[Question]
     filledPrompt: str
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import update, and_, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import make_cache, MemoryCache, RedisCache
+from config import OPENAI_API_KEY, GPT_CACHE_BACKEND, GPT_CACHE_SIZE, GPT_CACHE_TTL_SECONDS, REDIS_URL
+from history.models import GptInteraction
+from questions.models import Answer as AnswerModel
+from questions.models import Question as QuestionModel
+
+QuestionsData = list[tuple[QuestionModel, list[str], list[str], list[uuid.UUID], list[uuid.UUID]]]
+AnswersSnapshot = list[tuple[uuid.UUID, list[str | None], list[uuid.UUID]]]
+
+GPT_MODEL = 'gpt-4'
+OPENAI_URL = 'https://api.openai.com/v1/chat/completions'
+OPENAI_HEADERS = {'Content-Type': 'application/json',
+                  'Authorization': f'Bearer {OPENAI_API_KEY}'}
+
+gpt_cache = make_cache(backend=GPT_CACHE_BACKEND,
+                       maxsize=GPT_CACHE_SIZE,
+                       ttl=GPT_CACHE_TTL_SECONDS,
+                       prefix='gpt:',
+                       url=REDIS_URL)
+
+def get_gpt_cache() -> MemoryCache | RedisCache | None:
+    return gpt_cache
+
+def get_gpt_cache_key(filled_prompt: str, model: str=GPT_MODEL) -> str:
+    return f'{model}:{hashlib.sha256(filled_prompt.encode()).hexdigest()}'
+
+async def request_gpt_completion(client: httpx.AsyncClient, filled_prompt: str) -> str:
+    response = await client.post(
+        OPENAI_URL,
+        headers=OPENAI_HEADERS,
+        json={
+            'model': GPT_MODEL,
+            'messages': [{'role': 'user', 'content': filled_prompt}]
+        }
+    )
+
+    return response.json()['choices'][0]['message']['content']
+
+async def stream_gpt_completion(client: httpx.AsyncClient, filled_prompt: str) -> AsyncIterator[str]:
+    async with client.stream(
+        'POST',
+        OPENAI_URL,
+        headers=OPENAI_HEADERS,
+        json={
+            'model': GPT_MODEL,
+            'messages': [{'role': 'user', 'content': filled_prompt}],
+            'stream': True
+        }
+    ) as response:
+        if response.status_code >= 400:
+            raise HTTPException(status_code=502, detail='GPT service is unavailable')
+        async for line in response.aiter_lines():
+            if not line.startswith('data: '):
+                continue
+            data = line[len('data: '):]
+            if data == '[DONE]':
+                break
+            content = json.loads(data)['choices'][0]['delta'].get('content')
+            if content:
+                yield content
+
+async def cached_gpt_completion(client: httpx.AsyncClient,
+                                filled_prompt: str,
+                                cache: MemoryCache | RedisCache | None) -> str:
+    if cache is None:
+        return await request_gpt_completion(client, filled_prompt)
+
+    key = get_gpt_cache_key(filled_prompt)
+    if (response := await cache.get(key)) is not None:
+        return response
+
+    response = await request_gpt_completion(client, filled_prompt)
+    await cache.set(key, response)
+    return response
+
+async def cached_gpt_stream(client: httpx.AsyncClient,
+                            filled_prompt: str,
+                            cache: MemoryCache | RedisCache | None) -> AsyncIterator[str]:
+    if cache is None:
+        async for chunk in stream_gpt_completion(client, filled_prompt):
+            yield chunk
+        return
+
+    key = get_gpt_cache_key(filled_prompt)
+    if (response := await cache.get(key)) is not None:
+        yield response
+        return
+
+    chunks = []
+    async for chunk in stream_gpt_completion(client, filled_prompt):
+        chunks.append(chunk)
+        yield chunk
+    await cache.set(key, ''.join(chunks))
+
+def get_answers_snapshot(questions_data: QuestionsData) -> AnswersSnapshot:
+    return [(question_data[0].id, question_data[1], question_data[3]) for question_data in questions_data]
+
+async def save_interaction(session: AsyncSession,
+                           user_id: uuid.UUID,
+                           answers_snapshot: AnswersSnapshot,
+                           response: str,
+                           interaction_id: uuid.UUID | None=None) -> tuple[uuid.UUID, datetime]:
+    interaction_id = interaction_id if interaction_id is not None else uuid.uuid4()
+
+    session.add(GptInteraction(id=interaction_id,
+                               time_happened=(interaction_time := datetime.now()),
+                               response=response))
+    await session.flush()
+
+    snapshot_texts = {answer_id: ans_text
+                      for _, texts, ids in answers_snapshot
+                      for ans_text, answer_id in zip(texts, ids)}
+    claimed_ids = set((await session.execute(
+        update(AnswerModel)
+        .where(and_(AnswerModel.id.in_(snapshot_texts),
+                    AnswerModel.interaction_id.is_(None),
+                    AnswerModel.text.is_not_distinct_from(case(snapshot_texts, value=AnswerModel.id))))
+        .values(interaction_id=interaction_id)
+        .returning(AnswerModel.id)
+    )).scalars().all()) if snapshot_texts else set()
+
+    session.add_all([AnswerModel(id=uuid.uuid4(),
+                                 question_id=question_id,
+                                 text=ans_text,
+                                 user_id=user_id,
+                                 interaction_id=None if answer_id in claimed_ids else interaction_id)
+                     for question_id, texts, ids in answers_snapshot
+                     for ans_text, answer_id in zip(texts, ids)])
+    await session.flush()
+
+    return interaction_id, interaction_time
@@ -1,15 +1,28 @@
+import asyncio
 import datetime
 import os
 import subprocess
+import uuid
 
 from celery import Celery
 from celery.schedules import crontab
+from sqlalchemy import delete
 
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS
+from clients import get_openai_client
+from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS, CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from database import async_session_maker
+from payment.entitlements import touch_entitlements
+from payment.events import process_payment_events
+from payment.utils import settle_purchase
+from questions.models import GptJob
+from questions.utils import cached_gpt_completion, save_interaction, gpt_cache
 
-celery_app = Celery('tasks', broker='redis://localhost:6379')
+celery_app = Celery('tasks', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
 celery_app.conf.broker_connection_retry_on_startup = True
+celery_app.conf.result_expires = datetime.timedelta(days=1)
+
+loop = asyncio.new_event_loop()
 
 path = '../backups'
 
@@ -29,12 +42,82 @@ def copy_psql_db():
         subprocess.run(['git', 'commit', '-m', '"update db backup"'], cwd=path)
         subprocess.run(['git', 'push'], cwd=path)
 
+async def _generate_gpt_response(job_id: str,
+                                 user_id: str,
+                                 purchase_id: str | None,
+                                 reserved: int,
+                                 filled_prompt: str,
+                                 answers_snapshot: list[list]) -> dict:
+    try:
+        response = await cached_gpt_completion(get_openai_client(), filled_prompt, gpt_cache)
+
+        async with async_session_maker.begin() as session:
+            interaction_id, interaction_time = await save_interaction(
+                session=session,
+                user_id=uuid.UUID(user_id),
+                answers_snapshot=[(uuid.UUID(question_id), texts, [uuid.UUID(answer_id) for answer_id in answer_ids])
+                                  for question_id, texts, answer_ids in answers_snapshot],
+                response=response,
+                interaction_id=uuid.UUID(job_id)
+            )
+            if purchase_id is not None:
+                await settle_purchase(session, uuid.UUID(purchase_id), reserved, len(response))
+                await touch_entitlements(session, uuid.UUID(user_id))
+    except Exception:
+        if purchase_id is not None:
+            async with async_session_maker.begin() as session:
+                await settle_purchase(session, uuid.UUID(purchase_id), reserved, 0)
+                await touch_entitlements(session, uuid.UUID(user_id))
+        raise
+
+    return {'userId': user_id,
+            'answerId': str(interaction_id),
+            'dateTime': interaction_time.isoformat(),
+            'gptResponse': response}
+
+@celery_app.task(bind=True)
+def generate_gpt_response(self,
+                          user_id: str,
+                          purchase_id: str | None,
+                          reserved: int,
+                          filled_prompt: str,
+                          answers_snapshot: list[list]) -> dict:
+    return loop.run_until_complete(_generate_gpt_response(self.request.id,
+                                                          user_id,
+                                                          purchase_id,
+                                                          reserved,
+                                                          filled_prompt,
+                                                          answers_snapshot))
+
+async def _prune_gpt_jobs():
+    async with async_session_maker.begin() as session:
+        await session.execute(delete(GptJob)
+                              .where(GptJob.created_at < datetime.datetime.utcnow() - celery_app.conf.result_expires))
+
+@celery_app.task()
+def prune_gpt_jobs():
+    loop.run_until_complete(_prune_gpt_jobs())
+
+@celery_app.task()
+def process_payment_events_task() -> int:
+    return loop.run_until_complete(process_payment_events(async_session_maker))
+
 celery_app.conf.beat_schedule = {
     'run_every_day_at_4am': {
         'task': 'tasks.tasks.copy_psql_db',
         'schedule': crontab(hour=4, minute=0),
         'args': (),
     },
+    'prune_gpt_jobs_every_day': {
+        'task': 'tasks.tasks.prune_gpt_jobs',
+        'schedule': crontab(hour=4, minute=30),
+        'args': (),
+    },
+    'process_payment_events_every_minute': {
+        'task': 'tasks.tasks.process_payment_events_task',
+        'schedule': crontab(),
+        'args': (),
+    },
 }
 
 celery_app.conf.timezone = 'Europe/Moscow'
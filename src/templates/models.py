@@ -12,5 +12,5 @@ class Template(Base):
         self.title = title
 
     id = Column(UUID, primary_key=True)
-    user_id = Column(ForeignKey('users.id', ondelete='cascade'))
+    user_id = Column(ForeignKey('users.id', ondelete='cascade'), index=True)
     title = Column(String, nullable=False)
@@ -1,115 +1,116 @@
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import and_, select, func, text, literal_column
-from sqlalchemy.dialects.postgresql import aggregate_order_by
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, or_, select, insert, func, literal, Select, Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.routes import get_access_token
 from auth.utils import AccessTokenPayload
 from database import get_async_session
-from questions.models import Answer
-from questions.models import Option as OptionModel
-from questions.schemas import Option as OptionSchema
+from questions.answer_sets import get_answer_sets, get_question_schema
+from questions.catalog import CatalogSnapshot, catalog, get_catalog
+from questions.models import Answer, draft_answers_of
 from questions.models import Question as QuestionModel
-from questions.schemas import Question as QuestionSchema
 from templates.models import Template as TemplateModel
 from templates.schemas import Template as TemplateSchema, NewTemplate, NewTemplateSave
-from templates.schemas import TemplatesResponse
-from utils import try_uuid
+from templates.schemas import TemplatesResponse, TemplateCursor, TemplateHeader, TemplateHeadersResponse, \
+    TemplateHeaderResponse, TemplateResponse
+from utils import BaseResponse, encode_cursor, decode_cursor
 
 router = APIRouter(prefix='/templates', tags=['Templates'])
 
+def get_template_headers_query(user_id: uuid.UUID) -> Select:
+    return (select(TemplateModel.id,
+                   TemplateModel.title,
+                   func.array_agg(QuestionModel.category_id)[1],
+                   func.count(Answer.question_id.distinct()))
+            .join(Answer, Answer.template_id == TemplateModel.id)
+            .join(QuestionModel)
+            .where(TemplateModel.user_id == user_id)
+            .group_by(TemplateModel.id)
+            .order_by(TemplateModel.title, TemplateModel.id))
+
+def map_template_header(row: Row) -> TemplateHeader:
+    return TemplateHeader(id=row[0], title=row[1], categoryId=row[2], questionCount=row[3])
+
+async def get_template_header(session: AsyncSession,
+                              user_id: uuid.UUID,
+                              template_id: uuid.UUID) -> TemplateHeaderResponse:
+    row = (await session.execute(
+        get_template_headers_query(user_id).where(TemplateModel.id == template_id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail='template with this id doesnt exist')
+
+    return TemplateHeaderResponse(message='status success', template=map_template_header(row))
+
 async def get_templates_response(session: AsyncSession,
-                                 user_id: uuid.UUID) -> TemplatesResponse:
-    templates = (await session.execute(
-        select(text('id'),
-               text('array_agg(id_1)'),
-               text('array_agg(question_text)'),
-               text('array_agg(type_)'),
-               text('array_agg(snippet)'),
-               text('array_agg(option_ids)'),
-               text('array_agg(option_texts)'),
-               text('array_agg(question_answers)'),
-               text('array_agg(is_required)'),
-               text('category_id'),
-               text('title'))
-        .select_from(select(TemplateModel,
-                            QuestionModel,
-                            func.string_agg(Answer.text.distinct(), 'DEL').label('question_answers'),
-                            func.string_agg(text('option.id::text'), aggregate_order_by(literal_column("'DEL'"), OptionModel.option_text)).label('option_ids'),
-                            func.string_agg(OptionModel.option_text.distinct(), aggregate_order_by(literal_column("'DEL'"), OptionModel.option_text)).label('option_texts'))
-                     .join(Answer)
-                     .join(QuestionModel)
-                     .join(OptionModel, isouter=True)
-                     .where(Answer.user_id == user_id)
-                     .group_by(QuestionModel.id)
-                     .group_by(TemplateModel.id)
-                     .select_from(TemplateModel)
-                     .subquery(name='template'))
-        .group_by(text('template.id'))
-        .group_by(text('template.category_id'))
-        .group_by(text('template.title')))).all()
-
-    templates = list(map(lambda template:
-                            TemplateSchema(id=template[0],
-                                            userId=user_id,
-                                            title=template[10],
-                                            questions=[QuestionSchema(
-                                                id=id,
-                                                question=template[2][i],
-                                                questionType=template[3][i],
-                                                snippet=template[4][i],
-                                                options=[OptionSchema(id=uuid.UUID(hex=id),text=text)
-                                                         for id, text in zip(template[5][i].split('DEL'),
-                                                                             template[6][i].split('DEL'))]
-                                                if template[5][i] is not None else None,
-                                                answer=try_uuid(template[7][i])
-                                                if template[7][i] is not None and
-                                                   len(template[7][i].split('DEL')) == 1 else None,
-                                                answers=list(map(try_uuid, template[7][i].split('DEL')))
-                                                if template[7][i] is not None and
-                                                   len(template[7][i].split('DEL')) > 1 else None,
-                                                isRequired=template[8][i],
-                                                categoryId=template[9]
-                                            ) for i, id in enumerate(template[1])]), templates))
-
-    return TemplatesResponse(message='status success', templates=templates)
+                                 user_id: uuid.UUID,
+                                 template_ids: list[uuid.UUID]=None) -> TemplatesResponse:
+    query = (select(TemplateModel)
+             .where(TemplateModel.user_id == user_id)
+             .order_by(TemplateModel.title, TemplateModel.id))
+    if template_ids is not None:
+        query = query.where(TemplateModel.id.in_(template_ids))
+    templates = (await session.execute(query)).scalars().all()
+
+    answer_sets = await get_answer_sets(session=session,
+                                        snapshot=await catalog.get(session),
+                                        parent_key=Answer.template_id,
+                                        user_id=user_id,
+                                        parent_ids=[template.id for template in templates])
+
+    return TemplatesResponse(message='status success',
+                             templates=[TemplateSchema(id=template.id,
+                                                       userId=user_id,
+                                                       title=template.title,
+                                                       questions=answer_sets[template.id])
+                                        for template in templates if template.id in answer_sets])
 
 @router.put('')
 async def add_template(new_template: NewTemplateSave,
+                       compact: bool=False,
                        user_token: AccessTokenPayload=Depends(get_access_token),
-                       session: AsyncSession=Depends(get_async_session)) -> TemplatesResponse:
-    session.add(TemplateModel(id=(template_id := uuid.uuid4()),
-                              user_id=user_token.id,
-                              title=new_template.title))
-    await session.flush()
-    question_ids = (await session.execute(
-        select(QuestionModel.id)
-        .where(QuestionModel.category_id == new_template.categoryId)
-    )).scalars().all()
-
-    answers = (await session.execute(
-        select(Answer)
-        .where(and_(Answer.user_id == user_token.id,
-                    Answer.question_id.in_(question_ids),
-                    Answer.interaction_id.is_(None),
-                    Answer.template_id.is_(None))))
-               ).scalars().all()
-
-    new_answers = [Answer(id=uuid.uuid4(),
-                          question_id=answer.question_id,
-                          user_id=answer.user_id,
-                          text=answer.text) for answer in answers]
-    for answer in answers:
-        answer.template_id = template_id
-
-    session.add_all(answers)
-    session.add_all(new_answers)
-    await session.flush()
-
-    return await get_templates_response(session=session,
-                                        user_id=user_token.id)
+                       catalog_snapshot: CatalogSnapshot=Depends(get_catalog),
+                       session: AsyncSession=Depends(get_async_session)) -> TemplatesResponse | TemplateHeaderResponse:
+    templates, answers = TemplateModel.__table__, Answer.__table__
+    template = (insert(templates)
+                .values(id=(template_id := uuid.uuid4()), user_id=user_token.id, title=new_template.title)
+                .cte('new_template'))
+
+    template_answers = (await session.execute(
+        insert(answers)
+        .from_select(['id', 'question_id', 'user_id', 'text', 'template_id'],
+                     select(func.gen_random_uuid(), answers.c.question_id, answers.c.user_id, answers.c.text, literal(template_id, answers.c.template_id.type))
+                     .join(QuestionModel.__table__)
+                     .where(and_(QuestionModel.category_id == new_template.categoryId,
+                                 draft_answers_of(user_token.id))))
+        .add_cte(template)
+        .returning(answers.c.question_id, answers.c.text)
+    )).all()
+
+    if compact:
+        return TemplateHeaderResponse(message='status success',
+                                      template=TemplateHeader(id=template_id,
+                                                              title=new_template.title,
+                                                              categoryId=new_template.categoryId,
+                                                              questionCount=len({row[0] for row in template_answers})))
+
+    question_answers = {}
+    for question_id, text in template_answers:
+        question_answers.setdefault(question_id, set())
+        if text is not None:
+            question_answers[question_id].add(text)
+
+    questions = [get_question_schema(catalog_snapshot, question.id, sorted(question_answers[question.id]))
+                 for question in catalog_snapshot.questions_by_category.get(new_template.categoryId, [])
+                 if question.id in question_answers]
+
+    return TemplatesResponse(message='status success',
+                             templates=[TemplateSchema(id=template_id,
+                                                       userId=user_token.id,
+                                                       title=new_template.title,
+                                                       questions=questions)])
 
 @router.get('')
 async def get_templates(user_token: AccessTokenPayload=Depends(get_access_token),
@@ -117,22 +118,61 @@ async def get_templates(user_token: AccessTokenPayload=Depends(get_access_token)
     return await get_templates_response(session=session,
                                         user_id=user_token.id)
 
+@router.get('/page')
+async def get_templates_page(cursor: str=None,
+                             limit: int=Query(default=20, ge=1, le=100),
+                             user_token: AccessTokenPayload=Depends(get_access_token),
+                             session: AsyncSession=Depends(get_async_session)) -> TemplateHeadersResponse:
+    query = get_template_headers_query(user_token.id)
+    if cursor is not None:
+        cursor = decode_cursor(cursor, TemplateCursor)
+        query = query.where(or_(TemplateModel.title > cursor.title,
+                                and_(TemplateModel.title == cursor.title,
+                                     TemplateModel.id > cursor.id)))
+
+    templates = [map_template_header(row) for row in (await session.execute(query.limit(limit + 1))).all()]
+
+    return TemplateHeadersResponse(
+        message='status success',
+        templates=templates[:limit],
+        nextCursor=encode_cursor(TemplateCursor(title=templates[limit - 1].title, id=templates[limit - 1].id))
+        if len(templates) > limit else None
+    )
+
+@router.get('/{templateId}')
+async def get_template(templateId: uuid.UUID,
+                       user_token: AccessTokenPayload=Depends(get_access_token),
+                       session: AsyncSession=Depends(get_async_session)) -> TemplateResponse:
+    templates = (await get_templates_response(session=session,
+                                              user_id=user_token.id,
+                                              template_ids=[templateId])).templates
+    if not templates:
+        raise HTTPException(status_code=404, detail='template with this id doesnt exist')
+
+    return TemplateResponse(message='status success', template=templates[0])
+
 @router.delete('')
 async def delete_template(templateId: uuid.UUID,
+                          compact: bool=False,
                           user_token: AccessTokenPayload=Depends(get_access_token),
-                          session: AsyncSession=Depends(get_async_session)) -> TemplatesResponse:
+                          session: AsyncSession=Depends(get_async_session)) -> TemplatesResponse | BaseResponse:
     template = await session.get(TemplateModel, templateId)
+    if template is None:
+        raise HTTPException(status_code=404, detail='template with this id doesnt exist')
     if template.user_id != user_token.id:
         raise HTTPException(status_code=403, detail="can't delete foreign template")
     await session.delete(template)
     await session.flush()
+    if compact:
+        return BaseResponse(message='status success')
     return await get_templates_response(session=session,
                                         user_id=user_token.id)
 
 @router.post('')
 async def change_template(answers: NewTemplate,
+                          compact: bool=False,
                           user_token: AccessTokenPayload=Depends(get_access_token),
-                          session: AsyncSession=Depends(get_async_session)) -> TemplatesResponse:
+                          session: AsyncSession=Depends(get_async_session)) -> TemplatesResponse | TemplateHeaderResponse:
     old_answers = (await session.execute(
         select(Answer)
         .where(
@@ -153,5 +193,11 @@ async def change_template(answers: NewTemplate,
 
     session.add_all(changed_answers)
 
+    if compact:
+        await session.flush()
+        return await get_template_header(session=session,
+                                         user_id=user_token.id,
+                                         template_id=answers.templateId)
+
     return await get_templates_response(session=session,
                                         user_id=user_token.id)
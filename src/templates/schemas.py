@@ -19,4 +19,24 @@ class NewTemplate(BaseModel):
 
 class NewTemplateSave(BaseModel):
     categoryId: uuid.UUID
-    title: str
\ No newline at end of file
+    title: str
+
+class TemplateCursor(BaseModel):
+    title: str
+    id: uuid.UUID
+
+class TemplateHeader(BaseModel):
+    id: uuid.UUID
+    title: str
+    categoryId: uuid.UUID
+    questionCount: int
+
+class TemplateHeadersResponse(BaseResponse):
+    templates: list[TemplateHeader]
+    nextCursor: str | None
+
+class TemplateHeaderResponse(BaseResponse):
+    template: TemplateHeader
+
+class TemplateResponse(BaseResponse):
+    template: Template
@@ -13,7 +13,8 @@ class User(Base):
                  role: str='user',
                  balance: int=0,
                  company: str | None = None,
-                 till_date: datetime.datetime | None=None):
+                 till_date: datetime.datetime | None=None,
+                 entitlement_version: int=0):
         self.id = id
         self.chat_id = chat_id
         self.name = name
@@ -22,6 +23,7 @@ class User(Base):
         self.balance = balance
         self.till_date = till_date
         self.theme = theme
+        self.entitlement_version = entitlement_version
 
     __tablename__ = 'users'
     id = Column(UUID, primary_key=True)
@@ -32,3 +34,4 @@ class User(Base):
     balance = Column(Float, nullable=False)
     till_date = Column(TIMESTAMP)
     theme = Column(String, nullable=False)
+    entitlement_version = Column(Integer, nullable=False, default=0, server_default='0')
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, and_, update
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from auth.models import RefreshToken
 from auth.routes import get_access_token
+from auth.token_store import TokenStore, get_token_store
 from auth.utils import AccessTokenPayload, check_user_agent
 from database import get_async_session
 from users.models import User
@@ -20,8 +20,9 @@ router = APIRouter(prefix='/profile',
                                         498: {'model': BaseResponse, 'description': 'the access token is invalid'}})
 async def get_profile_route(user_agent: str=Depends(check_user_agent),
                             session: AsyncSession=Depends(get_async_session),
+                            token_store: TokenStore=Depends(get_token_store),
                             access_token: AccessTokenPayload=Depends(get_access_token)) -> UserProfileResponse:
-    return await get_profile(session, access_token.id, user_agent)
+    return await get_profile(session, token_store, access_token.id, user_agent)
 
 @router.post('/changeUsername', responses={200: {'model': UserProfile},
                                                 400: {'model': BaseResponse, 'description': 'error: User-Agent required'},
@@ -31,6 +32,7 @@ async def get_profile_route(user_agent: str=Depends(check_user_agent),
 async def change_username(username: Username,
                           user_agent: str=Depends(check_user_agent),
                           session: AsyncSession=Depends(get_async_session),
+                          token_store: TokenStore=Depends(get_token_store),
                           access_token: AccessTokenPayload=Depends(get_access_token)) -> UserProfileResponse:
 
     if (await session.execute(select(User).where(User.name == username.username))).scalar() is not None:
@@ -38,7 +40,7 @@ async def change_username(username: Username,
 
     await session.execute(update(User).where(User.id == access_token.id).values(name=username.username))
     await session.flush()
-    return await get_profile(session, access_token.id, user_agent)
+    return await get_profile(session, token_store, access_token.id, user_agent)
 
 @router.post('/changeTheme', responses={200: {'model': UserProfile},
                                              400: {'model': BaseResponse, 'description': 'error: User-Agent required'},
@@ -47,9 +49,9 @@ async def change_username(username: Username,
 async def change_theme(theme: Theme,
                        user_agent: str=Depends(check_user_agent),
                        session: AsyncSession=Depends(get_async_session),
+                       token_store: TokenStore=Depends(get_token_store),
                        access_token: AccessTokenPayload=Depends(get_access_token)):
-    await session.execute(update(RefreshToken).where(and_(RefreshToken.user_id == access_token.id,
-                        RefreshToken.user_agent == user_agent)).values(theme=theme.theme))
+    await token_store.set_theme(access_token.id, user_agent, theme.theme)
     await session.flush()
 
-    return await get_profile(session, access_token.id, user_agent)
\ No newline at end of file
+    return await get_profile(session, token_store, access_token.id, user_agent)
\ No newline at end of file
@@ -1,7 +1,10 @@
+import base64
+import binascii
 import uuid
 from _datetime import datetime, timedelta
 
-from pydantic import BaseModel
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel, ValidationError
 
 def msc_now() -> datetime:
     return datetime.utcnow() + timedelta(hours=3)
@@ -18,4 +21,29 @@ def try_uuid(s: str) -> uuid.UUID | str:
         uuid_s = uuid.UUID(hex=s)
         return uuid_s
     except ValueError:
-        return s
\ No newline at end of file
+        return s
+
+class Cursor(BaseModel):
+    time: datetime
+    id: uuid.UUID
+
+def encode_cursor(cursor: BaseModel) -> str:
+    return base64.urlsafe_b64encode(cursor.json().encode()).decode()
+
+def decode_cursor(cursor: str, cursor_class: type[BaseModel]=Cursor) -> BaseModel:
+    try:
+        return cursor_class.parse_raw(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error, ValidationError):
+        raise HTTPException(status_code=400, detail='invalid cursor')
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+def with_etag(request: Request, response: Response, etag: str, body: BaseModel) -> BaseModel | Response:
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    return body
@@ -1,9 +1,11 @@
 import asyncio
+import json
 import sys
 import uuid
 from datetime import datetime, timedelta
 from typing import AsyncGenerator
 
+import httpx
 import pytest_asyncio as pytest
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
@@ -20,9 +22,13 @@ from users.models import User
 from auth.models import Base, Auth, RefreshToken
 from questions.models import Category, Answer, Prompt, Option
 from questions.models import Question as QuestionModel
-from questions.routers import get_gpt_send, get_filled_prompt
+from questions.catalog import catalog
+from questions.routers import get_gpt_send, get_gpt_stream, get_filled_prompt
 from questions.schemas import Question as QuestionSchema
-from payment.utils import PaywallManager, PaywallManagerTest
+from payment.events import process_payment_events
+from payment.routers import get_payment_event_dispatcher
+from payment.utils import paywall, get_test_paywall
+from clients import get_yookassa_client
 
 _, test_engine, async_session_maker_test, get_async_session_test =  get_db(TEST_DB_HOST, TEST_DB_PORT, TEST_DB_NAME, TEST_DB_USER, TEST_DB_PASS)
 
@@ -35,9 +41,48 @@ def get_gpt_send_test():
 
     return get_gpt_response
 
+def get_gpt_stream_test():
+    async def get_gpt_response_stream(filled_prompt: str):
+        for word in f'test response not from gpt to prompt {filled_prompt}'.split(' '):
+            yield word + ' '
+
+    return get_gpt_response_stream
+
 app.dependency_overrides[get_async_session] = get_async_session_test
 app.dependency_overrides[get_gpt_send] = get_gpt_send_test
-app.dependency_overrides[PaywallManager] = PaywallManagerTest
+app.dependency_overrides[get_gpt_stream] = get_gpt_stream_test
+app.dependency_overrides[paywall] = get_test_paywall
+
+def get_payment_event_dispatcher_test():
+    async def dispatch_payment_events():
+        await process_payment_events(async_session_maker_test)
+
+    return dispatch_payment_events
+
+app.dependency_overrides[get_payment_event_dispatcher] = get_payment_event_dispatcher_test
+
+
+class FakeYooKassa:
+    ip = '185.71.76.1'
+
+    def __init__(self):
+        self.payments: dict[str, dict] = {}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method != 'POST' or request.url.path != '/v3/payments':
+            return httpx.Response(404)
+        payment_id = str(uuid.uuid4())
+        self.payments[payment_id] = json.loads(request.content)
+        return httpx.Response(200, json={'id': payment_id,
+                                         'status': 'pending',
+                                         'confirmation': {'type': 'redirect',
+                                                          'confirmation_url': f'https://yookassa.test/{payment_id}'}})
+
+    def notification(self, payment_id: str, event: str='payment.succeeded') -> dict:
+        return {'type': 'notification', 'event': event, 'object': {'id': payment_id, 'status': 'succeeded'}}
+
+    def webhook_client(self) -> AsyncClient:
+        return AsyncClient(transport=httpx.ASGITransport(app=app, client=(self.ip, 443)), base_url='http://test')
 
 @pytest.fixture(autouse=True, scope='session')
 async def prepare_database():
@@ -136,9 +181,11 @@ async def categories_in_db():
                            category_id=second_id,
                            text='super prompt 4 {1}',
                            order_index=1))
+    catalog.invalidate()
     yield first_id, second_id
     async with async_session_maker_test.begin() as session:
         await session.execute(delete(Category))
+    catalog.invalidate()
 
 @pytest.fixture()
 async def questions_in_db(categories_in_db, user_in_db):
@@ -213,6 +260,7 @@ async def questions_in_db(categories_in_db, user_in_db):
                            question_id=fifth_question_id,
                            text=None,
                            user_id=user_in_db))
+    catalog.invalidate()
 
     yield categories_in_db, [first_question_id,
                              second_question_id,
@@ -222,3 +270,12 @@ async def questions_in_db(categories_in_db, user_in_db):
     async with async_session_maker_test.begin() as session:
         await session.execute(delete(QuestionModel))
         await session.execute(delete(Answer))
+    catalog.invalidate()
+
+@pytest.fixture()
+async def fake_yookassa() -> AsyncGenerator[FakeYooKassa, None]:
+    fake = FakeYooKassa()
+    async with AsyncClient(transport=httpx.MockTransport(fake.handle)) as client:
+        app.dependency_overrides[get_yookassa_client] = lambda: client
+        yield fake
+    del app.dependency_overrides[get_yookassa_client]
@@ -1,9 +1,13 @@
+import csv
+import io
+import json
 import uuid
 
 import pytest
 
 from conftest import user_in_db, async_session_maker_test, AsyncClient
 from users.models import User
+from payment.schemas import AdminProduct, PromoCode
 from questions.schemas import AdminQuestion, FullOption, Category
 
 
@@ -175,3 +179,107 @@ async def test_get_admin_questions(questions_in_db,
     first_question.pop('id')
     first_question.pop('categoryId')
     assert first_question == expected_question
+
+async def test_category_change_refreshes_catalog(admin_in_db,
+                                                 authorisation,
+                                                 questions_in_db,
+                                                 ac: AsyncClient):
+    await ac.get('/question/categories',
+                 headers={'Authorization': authorisation})
+
+    category = uuids_to_hex(Category(id=questions_in_db[0][0],
+                                     title='renamed category',
+                                     description=None,
+                                     parentId=None,
+                                     isMainScreenPresented=True,
+                                     isCategoryScreenPresented=True,
+                                     orderIndex='0').dict())
+    await ac.post('/admin/category',
+                  headers={'Authorization': authorisation},
+                  json=category)
+
+    response = await ac.get('/question/categories',
+                            headers={'Authorization': authorisation})
+    titles = {category['title'] for category in response.json()['categories']}
+    assert 'renamed category' in titles
+    assert 'prompt' not in response.json()['categories'][0]
+
+async def test_export_history(admin_in_db,
+                              questions_in_db,
+                              authorisation,
+                              ac: AsyncClient):
+    for _ in range(2):
+        await ac.post('/question/response',
+                      headers={'Authorization': authorisation},
+                      json={'categoryId': questions_in_db[0][0].hex})
+
+    response = await ac.get('/admin/historyExport',
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 200
+    interactions = [json.loads(line) for line in response.text.splitlines()]
+    assert len(interactions) == 2
+    assert all(len(interaction['questions']) == 4 for interaction in interactions)
+    assert interactions[0]['dateTime'] <= interactions[1]['dateTime']
+
+    response = await ac.get('/admin/historyExport',
+                            headers={'Authorization': authorisation},
+                            params={'exportFormat': 'csv'})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0][0] == 'interactionId'
+    assert len(rows) == 9
+
+    response = await ac.get('/admin/historyExport',
+                            headers={'Authorization': authorisation},
+                            params={'categoryId': questions_in_db[0][1].hex})
+    assert response.status_code == 200
+    assert response.text == ''
+
+    response = await ac.get('/admin/historyExport',
+                            headers={'Authorization': authorisation},
+                            params={'exportFormat': 'xml'})
+    assert response.status_code == 422
+
+async def test_product_catalog_etag(admin_in_db,
+                                    authorisation,
+                                    ac: AsyncClient):
+    product = AdminProduct(id=uuid.uuid4(),
+                           title='catalog product',
+                           priceRubbles=1000,
+                           availabilityDurationDays=30,
+                           usageCount=None,
+                           description='catalog product description',
+                           categoryIds=[],
+                           expanding=False,
+                           expandable=False,
+                           categoriesSize=None,
+                           isPromo=False,
+                           returnUrl='http://localhost',
+                           promoCodes=[PromoCode(id=uuid.uuid4(),
+                                                 code=(code := uuid.uuid4().hex),
+                                                 discountAbsolute=100,
+                                                 discountPercent=10)])
+    await ac.post('/admin/product',
+                  headers={'Authorization': authorisation},
+                  content=product.json())
+
+    response = await ac.get('/pay/products', headers={'Authorization': authorisation})
+    etag = response.headers['ETag']
+    assert product.id.hex in {uuid.UUID(product['id']).hex for product in response.json()['data']}
+
+    response = await ac.get('/pay/products', headers={'Authorization': authorisation, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = await ac.get('/pay/promo',
+                            headers={'Authorization': authorisation},
+                            params={'productId': str(product.id), 'promoCode': code})
+    assert response.json()['newPrice'] == 810
+
+    await ac.delete('/admin/product',
+                    headers={'Authorization': authorisation},
+                    params={'productId': str(product.id)})
+
+    response = await ac.get('/pay/products', headers={'Authorization': authorisation, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert product.id.hex not in {uuid.UUID(product['id']).hex for product in response.json()['data']}
@@ -1,10 +1,19 @@
+import uuid
 from datetime import datetime, timedelta
 
 import  pytest
-from sqlalchemy import update
+from fastapi import HTTPException
+from sqlalchemy import select, update
 
-from auth.models import RefreshToken
+from auth.models import Auth, RefreshToken
+from auth.passwords import PasswordHasher, password_hasher
 from conftest import async_session_maker_test, AsyncClient, user_in_db, authorisation
+from auth.routes import generate_access_token
+from auth.schemas import AccessTokenHeader
+from auth.utils import AccessTokenPayload, base64_encode, encrypt
+from auth.token_store import LastUseWriter, PostgresTokenStore, RedisTokenStore, new_record
+from auth.verifier import AccessTokenVerifier
+from users.models import User
 
 @pytest.mark.parametrize('name, password, user_agent, status_code',
                          [('first_user', '1234', 'second-user-agent', 200),
@@ -22,6 +31,49 @@ async def test_login(ac: AsyncClient,
                                    'password': password})
     assert response.status_code == status_code
 
+async def test_login_upgrades_password_hash(ac: AsyncClient, user_in_db):
+    for _ in range(2):
+        response = await ac.post('/auth/login',
+                                 headers={'user-agent': 'second-user-agent'},
+                                 json={'username': 'first_user',
+                                       'password': '1234'})
+        assert response.status_code == 200
+
+    async with async_session_maker_test() as session:
+        auth = (await session.execute(select(Auth).where(Auth.user_id == user_in_db))).scalar()
+    assert (auth.algorithm, auth.params) == (password_hasher.algorithm, password_hasher.params)
+
+async def test_login_replaces_refresh_token(ac: AsyncClient, user_in_db):
+    async with async_session_maker_test.begin() as session:
+        await session.execute(update(RefreshToken)
+                              .where(RefreshToken.user_id == user_in_db)
+                              .values(theme='DARK_THEME'))
+
+    responses = [await ac.post('/auth/login',
+                               headers={'user-agent': 'first-user-agent'},
+                               json={'username': 'first_user',
+                                     'password': '1234'}) for _ in range(2)]
+
+    async with async_session_maker_test() as session:
+        tokens = (await session.execute(select(RefreshToken)
+                                        .where(RefreshToken.user_id == user_in_db))).scalars().all()
+    assert [response.status_code for response in responses] == [200, 200]
+    assert [token.theme for token in tokens] == ['DARK_THEME']
+
+@pytest.mark.parametrize('algorithm, params',
+                         [('hmac-sha256', ''),
+                          ('scrypt', 'n=1024,r=8,p=1'),
+                          ('pbkdf2-sha256', 'iterations=1000')])
+async def test_password_hasher(algorithm: str, params: str):
+    hasher = PasswordHasher(algorithm=algorithm, params=params, max_workers=1)
+    auth = Auth(algorithm=algorithm, params=params)
+    await hasher.set_password(auth, '1234')
+
+    assert await hasher.verify(auth, '1234')
+    assert not await hasher.verify(auth, '12345')
+    assert not hasher.needs_rehash(auth)
+    assert PasswordHasher(algorithm='scrypt', params='n=2048,r=8,p=1').needs_rehash(auth)
+
 @pytest.mark.parametrize('with_token, chane_token, status_code',
                          [(True, False, 200),
                           (True, True, 498),
@@ -131,4 +183,159 @@ async def test_change_password(ac: AsyncClient,
                                       'user-agent': 'first-user-agent'},
                              json={'oldPassword': old_password, 'newPassword': '12345'})
 
-    assert response.status_code == status_code
\ No newline at end of file
+    assert response.status_code == status_code
+
+def sign_access_token(payload: str) -> str:
+    token = base64_encode(AccessTokenHeader().json()) + '.' + base64_encode(payload)
+    return f'Bearer {token}.{base64_encode(encrypt(token))}'
+
+def test_access_token_verifier_caches_verified_tokens():
+    verifier = AccessTokenVerifier(cache_size=10)
+    authorization = 'Bearer ' + generate_access_token(User(id=uuid.uuid4(), chat_id=1, name='first_user'))
+
+    assert (user_token := verifier.verify(authorization)) is verifier.verify(authorization)
+    assert verifier.cache.hits == 1
+    with pytest.raises(TypeError):
+        user_token.role = 'admin'
+
+@pytest.mark.parametrize('authorization, status_code',
+                         [('Bearer not-a-token', 401),
+                          ('Bearer a.b.c.d', 401),
+                          (sign_access_token('{"id": "not-uuid"}'), 498),
+                          (sign_access_token(AccessTokenPayload(id=uuid.uuid4(),
+                                                                username='first_user',
+                                                                role='user',
+                                                                balance=0,
+                                                                tillDate=None,
+                                                                exp=int((datetime.utcnow() - timedelta(minutes=1))
+                                                                        .timestamp())).json()), 498),
+                          (sign_access_token('{}')[:-4] + 'AAA=', 498)])
+def test_access_token_verifier_rejects_invalid_tokens(authorization: str, status_code: int):
+    with pytest.raises(HTTPException) as error:
+        AccessTokenVerifier(cache_size=10).verify(authorization)
+    assert error.value.status_code == status_code
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    async def set(self, key: str, value: str, ex: int | None=None):
+        self.data[key] = value
+
+    async def getdel(self, key: str) -> str | None:
+        return self.data.pop(key, None)
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def scan_iter(self, match: str):
+        for key in list(self.data):
+            if key.startswith(match.rstrip('*')):
+                yield key
+
+    async def transaction(self, func, *watches: str):
+        pipe = FakePipeline(self)
+        await func(pipe)
+        self.data.update(pipe.writes)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.writes = {}
+
+    async def get(self, key: str) -> str | None:
+        return await self.redis.get(key)
+
+    def multi(self):
+        pass
+
+    def set(self, key: str, value: str, keepttl: bool=False):
+        self.writes[key] = value
+
+async def test_redis_token_store_rotates_tokens():
+    token_store = RedisTokenStore(FakeRedis(), LastUseWriter())
+    user_id = uuid.uuid4()
+
+    first = await token_store.issue(user_id, 'first-user-agent')
+    await token_store.set_theme(user_id, 'first-user-agent', 'DARK_THEME')
+    second = await token_store.rotate(user_id, 'first-user-agent', first.id)
+
+    assert second.id != first.id
+    assert second.theme == 'DARK_THEME'
+    assert (await token_store.verify(user_id, 'first-user-agent', second.id)).id == second.id
+
+    with pytest.raises(HTTPException) as error:
+        await token_store.rotate(user_id, 'first-user-agent', first.id)
+    assert error.value.status_code == 401
+
+    with pytest.raises(HTTPException) as error:
+        await token_store.verify(user_id, 'first-user-agent', second.id)
+    assert error.value.status_code == 404
+
+async def test_redis_token_store_revokes_user_tokens():
+    token_store = RedisTokenStore(FakeRedis(), LastUseWriter())
+    user_id = uuid.uuid4()
+    await token_store.issue(user_id, 'first-user-agent')
+    await token_store.issue(user_id, 'second-user-agent')
+    await token_store.issue(other_user_id := uuid.uuid4(), 'first-user-agent')
+
+    await token_store.revoke_user(user_id)
+
+    assert await token_store.get(user_id, 'first-user-agent') is None
+    assert await token_store.revoke(user_id, 'second-user-agent') is False
+    assert await token_store.revoke(other_user_id, 'first-user-agent') is True
+
+async def test_redis_last_use_updates_current_token():
+    token_store = RedisTokenStore(FakeRedis(), LastUseWriter())
+    user_id = uuid.uuid4()
+    first = await token_store.issue(user_id, 'first-user-agent')
+    token_store.touch(first)
+    await token_store.write_last_use(list(token_store.last_use.pending.values()))
+
+    assert (await token_store.get(user_id, 'first-user-agent')).last_use == first.last_use
+
+    second = await token_store.rotate(user_id, 'first-user-agent', first.id)
+    token_store.touch(first)
+    await token_store.write_last_use([first])
+
+    assert await token_store.get(user_id, 'first-user-agent') == second
+
+async def test_last_use_is_written_behind(ac: AsyncClient, user_in_db):
+    login_response = await ac.post('/auth/login',
+                                   headers={'user-agent': 'second-user-agent'},
+                                   json={'username': 'first_user',
+                                         'password': '1234'})
+    async with async_session_maker_test() as session:
+        record = await PostgresTokenStore(session, LastUseWriter()).get(user_in_db, 'second-user-agent')
+
+    writer = LastUseWriter()
+    writer.add(record)
+    await PostgresTokenStore.write_last_use(async_session_maker_test, list(writer.pending.values()))
+
+    async with async_session_maker_test() as session:
+        last_use = (await session.execute(select(RefreshToken.last_use)
+                                          .where(RefreshToken.id == record.id))).scalar()
+    assert login_response.status_code == 200
+    assert last_use == record.last_use
+
+async def test_last_use_writer_keeps_failed_batch(monkeypatch):
+    async def failed_write(session_maker, pending):
+        writer.add(newer)
+        raise ConnectionError('database is unavailable')
+
+    monkeypatch.setattr(PostgresTokenStore, 'write_last_use', failed_write)
+    writer = LastUseWriter()
+    first = new_record(uuid.uuid4(), 'first-user-agent')
+    second = new_record(uuid.uuid4(), 'first-user-agent')
+    newer = second.copy()
+    writer.add(first)
+    writer.add(second)
+
+    with pytest.raises(ConnectionError):
+        await writer.flush()
+    assert writer.pending == {first.id: first, second.id: newer}
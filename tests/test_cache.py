@@ -0,0 +1,58 @@
+import time
+
+from cache import LRUCache, MemoryCache
+from conftest import AsyncClient
+from questions.catalog import Catalog
+from test_admin import admin_in_db
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('first', 1)
+    cache.set('second', 2)
+    assert cache.get('first') == 1
+    cache.set('third', 3)
+
+    assert cache.get('second') is None
+    assert cache.get('first') == 1
+    assert cache.get('third') == 3
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set('first', 1)
+    cache.set('second', 2, ttl=60)
+    time.sleep(0.02)
+
+    assert cache.get('first') is None
+    assert cache.get('second') == 2
+    assert len(cache) == 1
+
+async def test_catalog_reloads_expired_snapshot():
+    async def load_snapshot(session, version: int) -> int:
+        return version
+
+    catalog = Catalog(load_snapshot, ttl=0.01)
+    assert await catalog.get(None) == 1
+    assert await catalog.get(None) == 1
+    time.sleep(0.02)
+
+    assert await catalog.get(None) == 2
+
+async def test_memory_cache_stats():
+    cache = MemoryCache(maxsize=10)
+    await cache.set('prompt', 'response')
+
+    assert await cache.get('prompt') == 'response'
+    assert await cache.get('other prompt') is None
+    assert await cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+async def test_gpt_cache_stats(ac: AsyncClient,
+                               admin_in_db,
+                               authorisation):
+    response = await ac.get('/admin/gptCache',
+                            headers={'Authorization': authorisation})
+
+    assert response.status_code == 200
+    assert {'enabled', 'hits', 'misses', 'size'} <= set(response.json())
@@ -84,3 +84,83 @@ async def test_delete_from_favorite(ac: AsyncClient,
         interactions = response.json()['data']
         assert len(interactions) == 1
         assert not interactions[0]['isFavorite']
+
+async def test_get_history_page(ac: AsyncClient,
+                                questions_in_db,
+                                authorisation):
+    for _ in range(3):
+        await ac.post('/question/response',
+                      headers={'Authorization': authorisation},
+                      json={'categoryId': questions_in_db[0][0].hex})
+
+    first_page = await ac.get('/history/gptHistoryPage',
+                              params={'categoryId': questions_in_db[0][0].hex, 'limit': 2},
+                              headers={'Authorization': authorisation})
+    assert first_page.status_code == 200
+    assert len(first_page.json()['data']) == 2
+    assert 'questions' not in first_page.json()['data'][0]
+    assert first_page.json()['nextCursor'] is not None
+
+    second_page = await ac.get('/history/gptHistoryPage',
+                               params={'categoryId': questions_in_db[0][0].hex,
+                                       'limit': 2,
+                                       'summary': False,
+                                       'cursor': first_page.json()['nextCursor']},
+                               headers={'Authorization': authorisation})
+    assert second_page.status_code == 200
+    assert len(second_page.json()['data']) == 1
+    assert len(second_page.json()['data'][0]['questions']) == 4
+    assert second_page.json()['nextCursor'] is None
+
+    ids = [interaction['id'] for interaction in first_page.json()['data'] + second_page.json()['data']]
+    assert len(set(ids)) == 3
+
+    response = await ac.get(f'/history/gptHistory/{ids[-1]}',
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 200
+    assert response.json()['data']['id'] == ids[-1]
+
+async def test_get_history_page_invalid_cursor(ac: AsyncClient,
+                                               questions_in_db,
+                                               authorisation):
+    response = await ac.get('/history/gptHistoryPage',
+                            params={'categoryId': questions_in_db[0][0].hex, 'cursor': 'not-a-cursor'},
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 400
+
+async def test_get_history_entity_not_found(ac: AsyncClient,
+                                            questions_in_db,
+                                            authorisation):
+    response = await ac.get(f'/history/gptHistory/{uuid.uuid4().hex}',
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 404
+
+async def test_favorite_compact(ac: AsyncClient,
+                                questions_in_db,
+                                authorisation):
+    for _ in range(2):
+        await ac.post('/question/response',
+                      headers={'Authorization': authorisation},
+                      json={'categoryId': questions_in_db[0][0].hex})
+
+    interaction_id = (await ac.get('/history/gptHistoryPage',
+                                   headers={'Authorization': authorisation},
+                                   params={'categoryId': questions_in_db[0][0].hex})).json()['data'][0]['id']
+
+    response = await ac.post('/history/gptHistoryFavorite',
+                             headers={'Authorization': authorisation},
+                             params={'compact': True},
+                             json={'id': interaction_id})
+    assert response.status_code == 200
+    assert response.json()['data'] == {'id': interaction_id, 'isFavorite': True}
+
+    favorites = (await ac.get('/history/gptHistoryPage',
+                              headers={'Authorization': authorisation},
+                              params={'categoryId': questions_in_db[0][0].hex, 'favorites': True})).json()['data']
+    assert [favorite['id'] for favorite in favorites] == [interaction_id]
+
+    response = await ac.delete('/history/gptHistoryFavorite',
+                               headers={'Authorization': authorisation},
+                               params={'id': interaction_id, 'compact': True})
+    assert response.status_code == 200
+    assert response.json()['data'] == {'id': interaction_id, 'isFavorite': False}
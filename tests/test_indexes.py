@@ -0,0 +1,76 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import select, and_, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from conftest import async_session_maker_test, questions_in_db, user_in_db
+from auth.models import Auth, RefreshToken
+from payment.models import Purchase, PromoCode
+from questions.models import Answer, Option, Prompt, Category, draft_answers_of
+from questions.models import Question as QuestionModel
+from questions.routers import get_question_data_query
+from history.routers import get_interactions_query
+from templates.models import Template
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+def get_seq_scans(plan: dict) -> list[str]:
+    seq_scans = [plan.get('Relation Name')] if plan['Node Type'] == 'Seq Scan' else []
+    for subplan in plan.get('Plans', []):
+        seq_scans += get_seq_scans(subplan)
+    return seq_scans
+
+hot_queries = {
+    'question_data': lambda user_id, category_id, question_id: get_question_data_query(user_id, category_id),
+    'draft_answer': lambda user_id, category_id, question_id:
+        select(Answer).where(and_(Answer.question_id == question_id, draft_answers_of(user_id))),
+    'history_answers': lambda user_id, category_id, question_id:
+        select(Answer).where(and_(Answer.user_id == user_id, Answer.interaction_id.is_not(None))),
+    'interaction_answers': lambda user_id, category_id, question_id:
+        select(Answer).where(Answer.interaction_id == uuid.uuid4()),
+    'template_answers': lambda user_id, category_id, question_id:
+        select(Answer).where(and_(Answer.user_id == user_id, Answer.template_id == uuid.uuid4())),
+    'favorite_interactions': lambda user_id, category_id, question_id:
+        get_interactions_query(user_id, favorites=True),
+    'templates': lambda user_id, category_id, question_id:
+        select(Template).where(Template.user_id == user_id),
+    'category_questions': lambda user_id, category_id, question_id:
+        select(QuestionModel).where(QuestionModel.category_id == category_id).order_by(QuestionModel.order_index),
+    'category_prompts': lambda user_id, category_id, question_id:
+        select(Prompt.text).where(Prompt.category_id == category_id).order_by(Prompt.order_index),
+    'child_categories': lambda user_id, category_id, question_id:
+        select(Category).where(Category.parent_id == category_id),
+    'question_options': lambda user_id, category_id, question_id:
+        select(Option).where(Option.question_id == question_id).order_by(Option.option_text),
+    'refresh_token': lambda user_id, category_id, question_id:
+        select(RefreshToken.theme).where(and_(RefreshToken.user_id == user_id,
+                                              RefreshToken.user_agent == 'first-user-agent')),
+    'auth': lambda user_id, category_id, question_id:
+        select(Auth).where(Auth.user_id == user_id),
+    'purchases': lambda user_id, category_id, question_id:
+        select(Purchase).where(Purchase.user_id == user_id),
+    'product_promo_codes': lambda user_id, category_id, question_id:
+        select(PromoCode).where(and_(PromoCode.product_id == uuid.uuid4(), PromoCode.code == 'promo')),
+}
+
+@pytest.mark.parametrize('query_name', hot_queries)
+async def test_hot_query_uses_indexes(questions_in_db, user_in_db, query_name: str):
+    statement = hot_queries[query_name](user_in_db, questions_in_db[0][0], questions_in_db[1][3])
+    async with async_session_maker_test.begin() as session:
+        await session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = (await session.execute(Explain(statement))).scalar()
+
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    assert get_seq_scans(plan[0]['Plan']) == []
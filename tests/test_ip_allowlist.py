@@ -0,0 +1,56 @@
+import ipaddress
+
+import pytest
+from fastapi import HTTPException, Request
+
+from config import YOOKASSA_NETWORKS
+from ip_allowlist import IpAllowlist, IpRanges
+
+TRUSTED_PROXIES = [ipaddress.ip_network('10.0.0.0/8'), ipaddress.ip_network('fd00::/8')]
+
+
+def make_request(host: str, forwarded_for: str | None=None) -> Request:
+    headers = [(b'x-forwarded-for', forwarded_for.encode())] if forwarded_for is not None else []
+    return Request({'type': 'http', 'client': (host, 443), 'headers': headers})
+
+@pytest.mark.parametrize('network', YOOKASSA_NETWORKS, ids=str)
+def test_ip_ranges_cover_configured_networks(network):
+    ranges = IpRanges(YOOKASSA_NETWORKS)
+    outside = [ip for ip in (network.network_address - 1, network.broadcast_address + 1)
+               if not any(ip in other for other in YOOKASSA_NETWORKS)]
+
+    assert network.network_address in ranges
+    assert network.broadcast_address in ranges
+    assert not any(ip in ranges for ip in outside)
+
+def test_ip_ranges_merge_and_map_ipv4():
+    ranges = IpRanges([ipaddress.ip_network('192.168.0.0/25'),
+                       ipaddress.ip_network('192.168.0.128/25'),
+                       ipaddress.ip_network('192.168.0.64/26')])
+
+    assert ranges.ranges[4] == ([int(ipaddress.ip_address('192.168.0.0'))],
+                                [int(ipaddress.ip_address('192.168.0.255'))])
+    assert ipaddress.ip_address('::ffff:192.168.0.10') in ranges
+    assert ipaddress.ip_address('192.168.1.0') not in ranges
+    assert ipaddress.ip_address('::1') not in ranges
+
+@pytest.mark.parametrize('host, forwarded_for, allowed',
+                         [('185.71.76.1', None, True),
+                          ('2a02:5180::1', None, True),
+                          ('8.8.8.8', None, False),
+                          ('8.8.8.8', '185.71.76.1', False),
+                          ('10.0.0.1', '185.71.76.1', True),
+                          ('10.0.0.1', '185.71.76.1, 10.0.0.2', True),
+                          ('10.0.0.1', '185.71.76.1, 8.8.8.8', False),
+                          ('fd00::1', '77.75.156.11', True),
+                          ('10.0.0.1', 'not-an-ip', False),
+                          ('10.0.0.1', None, False)])
+async def test_ip_allowlist_respects_trusted_proxies(host: str, forwarded_for: str | None, allowed: bool):
+    allowlist = IpAllowlist(YOOKASSA_NETWORKS, TRUSTED_PROXIES)
+    request = make_request(host, forwarded_for)
+
+    assert allowlist.is_allowed(request) is allowed
+    if not allowed:
+        with pytest.raises(HTTPException) as error:
+            await allowlist(request)
+        assert error.value.status_code == 403
@@ -0,0 +1,139 @@
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conftest import AsyncClient, async_session_maker_test, user_in_db, authorisation, fake_yookassa
+from payment.catalog import product_catalog
+from payment.events import record_payment_event, process_payment_events
+from payment.models import PaymentEvent, Product, Purchase
+from payment.replay import replay_payment_events
+
+
+async def add_free_product(session: AsyncSession):
+    if (await session.execute(select(Product).where(Product.title == 'free'))).scalars().first() is None:
+        session.add(Product(id=uuid.uuid4(),
+                            price_rubbles=0,
+                            description='free product',
+                            return_url='http://localhost',
+                            title='free'))
+
+async def test_payment_webhook_is_applied_once(ac: AsyncClient,
+                                               user_in_db,
+                                               authorisation,
+                                               fake_yookassa):
+    async with async_session_maker_test.begin() as session:
+        await add_free_product(session)
+        session.add(Product(id=(product_id := uuid.uuid4()),
+                            price_rubbles=500,
+                            description='webhook product',
+                            return_url='http://localhost',
+                            title='webhook product',
+                            availability_duration_days=30,
+                            usage_count=10))
+    product_catalog.invalidate()
+
+    response = await ac.post('/pay/url',
+                             headers={'Authorization': authorisation},
+                             json={'id': str(product_id), 'promoCode': None, 'categories': None})
+    assert response.status_code == 200
+    payment_id, payment = next(iter(fake_yookassa.payments.items()))
+    assert payment['amount']['value'] == '500'
+
+    async with fake_yookassa.webhook_client() as webhook_client:
+        responses = [await webhook_client.post('/pay/succeeded', json=fake_yookassa.notification(payment_id))
+                     for _ in range(2)]
+
+    async with async_session_maker_test() as session:
+        events = (await session.execute(select(PaymentEvent)
+                                        .where(PaymentEvent.event_key == f'payment.succeeded:{payment_id}'))).scalars().all()
+        purchases = (await session.execute(select(Purchase.remaining_uses)
+                                           .where(Purchase.user_id == user_in_db,
+                                                  Purchase.product_id == product_id))).scalars().all()
+    assert [response.status_code for response in responses] == [200, 200]
+    assert [event.processed_at is not None and event.error is None for event in events] == [True]
+    assert purchases == [10]
+
+async def test_worker_payment_reaches_cached_profile(ac: AsyncClient,
+                                                     user_in_db,
+                                                     authorisation,
+                                                     fake_yookassa):
+    async with async_session_maker_test.begin() as session:
+        await add_free_product(session)
+        session.add(Product(id=(product_id := uuid.uuid4()),
+                            price_rubbles=300,
+                            description='worker product',
+                            return_url='http://localhost',
+                            title='worker product',
+                            usage_count=25))
+    product_catalog.invalidate()
+
+    async def get_remaining_uses() -> int | None:
+        response = await ac.get('profile/profile',
+                                headers={'Authorization': authorisation,
+                                         'user-agent': 'first-user-agent'})
+        return response.json()['data']['access']['remainingUses']
+
+    response = await ac.post('/pay/url',
+                             headers={'Authorization': authorisation},
+                             json={'id': str(product_id), 'promoCode': None, 'categories': None})
+    assert response.status_code == 200
+    assert await get_remaining_uses() != 25
+
+    async with async_session_maker_test.begin() as session:
+        await record_payment_event(session, fake_yookassa.notification(list(fake_yookassa.payments)[-1]))
+    assert await process_payment_events(async_session_maker_test) >= 1
+
+    assert await get_remaining_uses() == 25
+
+async def test_expired_product_catalog_reads_new_price(ac: AsyncClient,
+                                                       user_in_db,
+                                                       authorisation,
+                                                       fake_yookassa):
+    async with async_session_maker_test.begin() as session:
+        session.add(Product(id=(product_id := uuid.uuid4()),
+                            price_rubbles=500,
+                            description='repriced product',
+                            return_url='http://localhost',
+                            title='repriced product'))
+    product_catalog.invalidate()
+
+    async def pay() -> str:
+        response = await ac.post('/pay/url',
+                                 headers={'Authorization': authorisation},
+                                 json={'id': str(product_id), 'promoCode': None, 'categories': None})
+        assert response.status_code == 200
+        return list(fake_yookassa.payments.values())[-1]['amount']['value']
+
+    assert await pay() == '500'
+    async with async_session_maker_test.begin() as session:
+        await session.execute(update(Product).where(Product.id == product_id).values(price_rubbles=700))
+    assert await pay() == '500'
+
+    product_catalog.expires_at = 0.0
+    assert await pay() == '700'
+
+async def test_payment_webhook_rejects_unknown_ip(ac: AsyncClient):
+    response = await ac.post('/pay/succeeded',
+                             json={'event': 'payment.succeeded', 'object': {'id': str(uuid.uuid4())}})
+    assert response.status_code == 403
+
+async def test_replay_failed_payment_events():
+    async with async_session_maker_test.begin() as session:
+        session.add(PaymentEvent(id=(event_id := uuid.uuid4()),
+                                 event_key=f'payment.succeeded:{uuid.uuid4()}',
+                                 event='payment.succeeded',
+                                 payload=json.dumps({'event': 'payment.succeeded', 'object': {'id': str(uuid.uuid4())}}),
+                                 received_at=datetime.utcnow(),
+                                 processed_at=datetime.utcnow(),
+                                 error='ConnectionError()'))
+
+    assert await replay_payment_events(async_session_maker_test, failed=True) >= 1
+
+    async with async_session_maker_test() as session:
+        event = await session.get(PaymentEvent, event_id)
+        pending = (await session.execute(select(func.count())
+                                         .where(PaymentEvent.processed_at.is_(None)))).scalar()
+    assert (event.processed_at is not None, event.error, pending) == (True, None, 0)
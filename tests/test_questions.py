@@ -1,10 +1,26 @@
+import asyncio
+import json
 import uuid
+from datetime import datetime
 
 import  pytest
-from sqlalchemy import update
+from fastapi import HTTPException
+from sqlalchemy import select, update
 
-from conftest import AsyncClient, async_session_maker_test, categories_in_db, questions_in_db, authorisation
-from questions.models import Question
+from conftest import AsyncClient, async_session_maker_test, categories_in_db, questions_in_db, authorisation, \
+    get_gpt_stream_test
+from config import PAYWALL_RESERVE_SYMBOLS
+from main import app
+from payment.entitlements import touch_entitlements
+from payment.models import Product, Purchase, PurchaseCategory
+from payment.utils import paywall, get_paywall, get_test_paywall, reserve_purchase
+from questions.catalog import catalog
+from questions.models import Answer, Question, GptJob
+from questions.prompts import CompiledPrompt
+from questions.routers import get_question_data, get_gpt_stream
+from questions.utils import get_answers_snapshot, save_interaction
+from tasks import tasks
+from users.models import User
 
 async def test_get_categories(ac: AsyncClient,
                               categories_in_db,
@@ -36,6 +52,11 @@ async def test_get_questions(ac: AsyncClient,
     first_question = list(filter(lambda q: q['question'] == 'super-question-test-text-1',
                                  response.json()['questions']))[0]
     assert first_question['answer'] == 'super-answer-1'
+    options_question = list(filter(lambda q: q['question'] == 'super-question-test-text-4',
+                                   response.json()['questions']))[0]
+    assert [option['text'] for option in options_question['options']] == ['first option text', 'second option text']
+    assert options_question['answer'] == questions_in_db[2].hex
+    assert [q['question'] for q in response.json()['questions']] == sorted(question_texts)
 
 @pytest.mark.parametrize('all_answers_required, status_code',
                          [(False, 200),
@@ -49,6 +70,7 @@ async def test_gpt_response(ac: AsyncClient,
     if all_answers_required:
         async with async_session_maker_test.begin() as session:
             await session.execute(update(Question).values(is_required=True))
+        catalog.invalidate()
 
     response = await ac.post('/question/response',
                              headers={'Authorization': authorisation},
@@ -90,3 +112,163 @@ async def test_answer(ac: AsyncClient,
                                    'answer': answer,
                                    'answers': answers})
     assert response.status_code == status_code
+
+async def test_gpt_response_stream(ac: AsyncClient,
+                                   questions_in_db,
+                                   authorisation):
+    response = await ac.post('/question/responseStream',
+                             headers={'Authorization': authorisation},
+                             json={'categoryId': questions_in_db[0][0].hex})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = [event for event in response.text.split('\n\n') if event]
+    done_event = events[-1]
+    assert done_event.startswith('event: done\ndata: ')
+    done = json.loads(done_event[len('event: done\ndata: '):])
+    deltas = [json.loads(event[len('data: '):])['delta'] for event in events[:-1]]
+    assert ''.join(deltas) == done['gptResponse']
+    assert len(done['questions']) == 4
+
+    history = await ac.get('/history/gptHistory',
+                           params={'categoryId': questions_in_db[0][0].hex},
+                           headers={'Authorization': authorisation})
+    assert len(history.json()['data']) == 1
+
+@pytest.mark.parametrize('chunks_before_failure, status_code', [(0, 502), (2, 200)])
+async def test_gpt_response_stream_upstream_failure(ac: AsyncClient,
+                                                    questions_in_db,
+                                                    authorisation,
+                                                    chunks_before_failure,
+                                                    status_code):
+    def get_failing_stream():
+        async def get_gpt_response_stream(filled_prompt: str):
+            for _ in range(chunks_before_failure):
+                yield 'chunk '
+            raise HTTPException(status_code=502, detail='GPT service is unavailable')
+
+        return get_gpt_response_stream
+
+    app.dependency_overrides[get_gpt_stream] = get_failing_stream
+    try:
+        response = await ac.post('/question/responseStream',
+                                 headers={'Authorization': authorisation},
+                                 json={'categoryId': questions_in_db[0][0].hex})
+    finally:
+        app.dependency_overrides[get_gpt_stream] = get_gpt_stream_test
+
+    assert response.status_code == status_code
+    if status_code == 200:
+        events = [event for event in response.text.split('\n\n') if event]
+        assert events[:-1] == ['data: {"delta": "chunk "}'] * chunks_before_failure
+        assert events[-1].startswith('event: error\ndata: ')
+
+    history = await ac.get('/history/gptHistory',
+                           params={'categoryId': questions_in_db[0][0].hex},
+                           headers={'Authorization': authorisation})
+    assert len(history.json()['data']) == 0
+
+async def test_gpt_job_is_hidden_from_other_users(ac: AsyncClient,
+                                                  user_in_db,
+                                                  authorisation):
+    async with async_session_maker_test.begin() as session:
+        session.add(User(id=(other_user_id := uuid.uuid4()), chat_id=4321, name='other_user'))
+        await session.flush()
+        session.add(GptJob(id=(job_id := uuid.uuid4()), user_id=other_user_id, created_at=datetime.utcnow()))
+
+    responses = [await ac.get(f'/question/response/{id}', headers={'Authorization': authorisation})
+                 for id in (job_id, uuid.uuid4())]
+
+    assert [response.status_code for response in responses] == [404, 404]
+
+def test_compiled_prompt_skips_lines_without_answers():
+    prompt = CompiledPrompt(['intro', 'first {1}', 'second {2} and {1}', 'third {3}', '{{literal}} {2}'])
+
+    assert prompt.fill([None, 'a', None, None]) == 'intro\nfirst a\nsecond None and a'
+    assert prompt.fill([None, None, 'b', 'c']) == 'intro\nsecond b and None\nthird c\n{literal} b'
+
+
+async def test_parallel_gpt_responses_share_one_purchase(ac: AsyncClient,
+                                                         questions_in_db,
+                                                         user_in_db,
+                                                         authorisation):
+    remaining_uses = 100 * PAYWALL_RESERVE_SYMBOLS + 7
+    async with async_session_maker_test.begin() as session:
+        session.add(Product(id=(product_id := uuid.uuid4()),
+                            price_rubbles=100,
+                            description='product',
+                            return_url='http://localhost',
+                            title='product'))
+        await session.flush()
+        session.add(Purchase(id=(purchase_id := uuid.uuid4()),
+                             user_id=user_in_db,
+                             product_id=product_id,
+                             expiration_time=None,
+                             remaining_uses=remaining_uses))
+        await session.flush()
+        session.add(PurchaseCategory(purchase_id=purchase_id, category_id=questions_in_db[0][0]))
+        await touch_entitlements(session, user_in_db)
+    await ac.post('/question/questions',
+                  headers={'Authorization': authorisation},
+                  json={'questionId': questions_in_db[1][4].hex, 'answer': 'answer', 'answers': None})
+
+    app.dependency_overrides[paywall] = get_paywall
+    try:
+        responses = await asyncio.gather(*[ac.post('/question/response',
+                                                   headers={'Authorization': authorisation},
+                                                   json={'categoryId': questions_in_db[0][1].hex})
+                                           for _ in range(100)])
+    finally:
+        app.dependency_overrides[paywall] = get_test_paywall
+
+    async with async_session_maker_test() as session:
+        purchase = await session.get(Purchase, purchase_id)
+
+    assert [response.status_code for response in responses] == [200] * 100
+    assert purchase.remaining_uses == remaining_uses - sum(len(response.json()['gptResponse'])
+                                                           for response in responses)
+
+async def test_failed_gpt_job_refunds_reservation(user_in_db, monkeypatch):
+    async with async_session_maker_test.begin() as session:
+        session.add(Product(id=(product_id := uuid.uuid4()),
+                            price_rubbles=100,
+                            description='product',
+                            return_url='http://localhost',
+                            title='product'))
+        await session.flush()
+        session.add(Purchase(id=(purchase_id := uuid.uuid4()),
+                             user_id=user_in_db,
+                             product_id=product_id,
+                             expiration_time=None,
+                             remaining_uses=10))
+
+    async def failed_completion(*args):
+        raise RuntimeError('GPT service is unavailable')
+
+    monkeypatch.setattr(tasks, 'cached_gpt_completion', failed_completion)
+    monkeypatch.setattr(tasks, 'async_session_maker', async_session_maker_test)
+
+    async with async_session_maker_test.begin() as session:
+        reserved = await reserve_purchase(session, purchase_id, PAYWALL_RESERVE_SYMBOLS)
+    with pytest.raises(RuntimeError):
+        await tasks._generate_gpt_response(str(uuid.uuid4()), str(user_in_db), str(purchase_id), reserved, 'prompt', [])
+
+    async with async_session_maker_test() as session:
+        purchase = await session.get(Purchase, purchase_id)
+    assert (reserved, purchase.remaining_uses) == (10, 10)
+
+async def test_save_interaction_keeps_drafts_edited_after_snapshot(questions_in_db, user_in_db):
+    first_question_id = questions_in_db[1][0]
+    async with async_session_maker_test() as session:
+        snapshot = get_answers_snapshot(await get_question_data(user_in_db, session, questions_in_db[0][0]))
+    async with async_session_maker_test.begin() as session:
+        await session.execute(update(Answer).where(Answer.question_id == first_question_id).values(text='edited answer'))
+
+    async with async_session_maker_test.begin() as session:
+        interaction_id, _ = await save_interaction(session, user_in_db, snapshot, 'response')
+
+    async with async_session_maker_test() as session:
+        answers = (await session.execute(select(Answer.interaction_id, Answer.text)
+                                         .where(Answer.question_id == first_question_id))).all()
+    assert sorted(answers, key=lambda answer: answer[0] is None) == [(interaction_id, 'super-answer-1'),
+                                                                     (None, 'edited answer')]
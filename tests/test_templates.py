@@ -99,3 +99,80 @@ async def test_delete_template(ac: AsyncClient,
 
     assert response.status_code == 200
     assert response.json()['templates'] == []
+
+async def test_get_templates_keeps_delimiter_in_answers(ac: AsyncClient,
+                                                        templates_in_db,
+                                                        questions_in_db,
+                                                        authorisation):
+    async with async_session_maker_test.begin() as session:
+        await session.execute(
+            update(Answer)
+            .where(Answer.question_id == questions_in_db[1][0])
+            .values(text='first DEL second')
+        )
+
+    response = await ac.get('/templates',
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 200
+    questions = {question['id']: question for question in response.json()['templates'][0]['questions']}
+    assert questions[str(questions_in_db[1][0])]['answer'] == 'first DEL second'
+
+async def test_add_template_returns_only_new_template(ac: AsyncClient,
+                                                      templates_in_db,
+                                                      questions_in_db,
+                                                      authorisation):
+    response = await ac.put('/templates',
+                            headers={'Authorization': authorisation},
+                            json={'categoryId': questions_in_db[0][0].hex,
+                                  'title': 'super template 2'})
+
+    assert response.status_code == 200
+    templates = response.json()['templates']
+    assert len(templates) == 1
+    assert templates[0]['title'] == 'super template 2'
+
+    response = await ac.get('/templates',
+                            headers={'Authorization': authorisation})
+    assert len(response.json()['templates']) == 2
+
+async def test_get_templates_page(ac: AsyncClient,
+                                  user_in_db,
+                                  questions_in_db,
+                                  authorisation):
+    for title in ('first template', 'second template'):
+        response = await ac.put('/templates',
+                                headers={'Authorization': authorisation},
+                                params={'compact': True},
+                                json={'categoryId': questions_in_db[0][0].hex,
+                                      'title': title})
+        assert response.status_code == 200
+        assert response.json()['template']['questionCount'] == 4
+
+    first_page = await ac.get('/templates/page',
+                              headers={'Authorization': authorisation},
+                              params={'limit': 1})
+    assert first_page.status_code == 200
+    assert [template['title'] for template in first_page.json()['templates']] == ['first template']
+    assert first_page.json()['templates'][0]['categoryId'] == str(questions_in_db[0][0])
+
+    second_page = await ac.get('/templates/page',
+                               headers={'Authorization': authorisation},
+                               params={'limit': 1, 'cursor': first_page.json()['nextCursor']})
+    assert [template['title'] for template in second_page.json()['templates']] == ['second template']
+    assert second_page.json()['nextCursor'] is None
+
+    template_id = second_page.json()['templates'][0]['id']
+    response = await ac.get(f'/templates/{template_id}',
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 200
+    assert len(response.json()['template']['questions']) == 4
+
+    response = await ac.delete('/templates',
+                               headers={'Authorization': authorisation},
+                               params={'templateId': template_id, 'compact': True})
+    assert response.status_code == 200
+    assert response.json() == {'message': 'status success'}
+
+    response = await ac.get(f'/templates/{template_id}',
+                            headers={'Authorization': authorisation})
+    assert response.status_code == 404
@@ -1,6 +1,11 @@
+import uuid
+from datetime import datetime, timedelta
+
 import pytest
 
-from conftest import AsyncClient, user_in_db, authorisation
+from conftest import AsyncClient, async_session_maker_test, user_in_db, authorisation, categories_in_db
+from payment.entitlements import EntitlementSnapshot, PurchaseEntitlement, touch_entitlements
+from payment.models import Product, Purchase, PurchaseCategory
 
 @pytest.mark.parametrize('username, status_code',
                          [('new_username', 200),
@@ -36,4 +41,49 @@ async def test_get_profile(ac: AsyncClient,
                                      'user-agent': 'first-user-agent'})
     assert response.status_code == 200
     assert response.json()['data']['username'] == 'first_user'
-    assert response.json()['data']['theme'] == 'LIGHT_THEME'
\ No newline at end of file
+    assert response.json()['data']['theme'] == 'LIGHT_THEME'
+
+async def test_profile_access_is_cached_until_entitlements_change(ac: AsyncClient,
+                                                                  user_in_db,
+                                                                  categories_in_db,
+                                                                  authorisation):
+    async def get_category_ids() -> list[str]:
+        response = await ac.get('profile/profile',
+                                headers={'Authorization': authorisation,
+                                         'user-agent': 'first-user-agent'})
+        return response.json()['data']['access']['categoryIds']
+
+    assert await get_category_ids() == []
+
+    async with async_session_maker_test.begin() as session:
+        session.add(Product(id=(product_id := uuid.uuid4()),
+                            price_rubbles=100,
+                            description='product',
+                            return_url='http://localhost',
+                            title='product'))
+        await session.flush()
+        session.add(Purchase(id=(purchase_id := uuid.uuid4()),
+                             user_id=user_in_db,
+                             product_id=product_id,
+                             expiration_time=None,
+                             remaining_uses=10))
+        await session.flush()
+        session.add(PurchaseCategory(purchase_id=purchase_id, category_id=categories_in_db[0]))
+
+    assert await get_category_ids() == []
+    async with async_session_maker_test.begin() as session:
+        await touch_entitlements(session, user_in_db)
+    assert await get_category_ids() == [str(categories_in_db[0])]
+
+def test_entitlement_snapshot_finds_active_purchase():
+    category_id = uuid.uuid4()
+    expired = PurchaseEntitlement(uuid.uuid4(), 'product', datetime.now() - timedelta(days=1), None, [category_id], None)
+    used_up = PurchaseEntitlement(uuid.uuid4(), 'product', None, 0, [category_id], None)
+    by_product = PurchaseEntitlement(uuid.uuid4(), 'free', None, None, None, [category_id])
+    by_purchase = PurchaseEntitlement(uuid.uuid4(), 'product', None, 5, [category_id], None)
+    snapshot = EntitlementSnapshot([expired, used_up, by_product, by_purchase])
+
+    assert snapshot.find_purchase(category_id) is by_purchase
+    assert EntitlementSnapshot([expired, used_up, by_product]).find_purchase(category_id) is by_product
+    assert snapshot.find_purchase(uuid.uuid4()) is None
+    assert snapshot.access().remainingUses is None